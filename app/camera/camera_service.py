@@ -1,5 +1,6 @@
-import picamera
+import asyncio
 import io
+import random
 import time
 import aiohttp
 import os
@@ -9,46 +10,182 @@ load_dotenv()
 
 NGROK_URL_BASE = os.getenv('VITE_NGROK_URL_BASE', 'http://localhost:8000')
 API_URL = NGROK_URL_BASE
+FRIDGE_ID = os.getenv('FRIDGE_ID', 'default')
+
+# Seconds between shots: MONITOR_INTERVAL normally, MONITOR_ACTIVE_INTERVAL right after
+# the backend reports a change, growing by MONITOR_IDLE_GROWTH per unchanged shot up to
+# MONITOR_IDLE_INTERVAL.
+MONITOR_INTERVAL = float(os.getenv('MONITOR_INTERVAL', '3600'))
+MONITOR_ACTIVE_INTERVAL = float(os.getenv('MONITOR_ACTIVE_INTERVAL', '300'))
+MONITOR_IDLE_INTERVAL = float(os.getenv('MONITOR_IDLE_INTERVAL', '14400'))
+MONITOR_IDLE_GROWTH = float(os.getenv('MONITOR_IDLE_GROWTH', '2'))
+# Failed shots are retried after a jittered exponential backoff, capped at MONITOR_MAX_BACKOFF
+MONITOR_BACKOFF = float(os.getenv('MONITOR_BACKOFF', '10'))
+MONITOR_MAX_BACKOFF = float(os.getenv('MONITOR_MAX_BACKOFF', '600'))
+UPLOAD_TIMEOUT = float(os.getenv('UPLOAD_TIMEOUT', '60'))
+
+class FakeCamera:
+    """Stand-in for picamera.PiCamera that writes the JPEGs it is given, for running without a Pi.
+
+    `frames` is a list of JPEG bytes; each capture returns the next one and
+    the last is repeated once they run out.
+    """
+
+    def __init__(self, frames, capture_seconds=0.0):
+        self.frames = list(frames)
+        self.capture_seconds = capture_seconds
+        self.captures = 0
+        self.resolution = None
+        self.framerate = None
+
+    def capture(self, stream, format='jpeg'):
+        time.sleep(self.capture_seconds)
+        stream.write(self.frames[min(self.captures, len(self.frames) - 1)])
+        self.captures += 1
+
+    def close(self):
+        pass
 
 class FridgeCamera:
-    def __init__(self):
-        self.camera = picamera.PiCamera()
-        self.camera.resolution = (640, 480)
-        self.camera.framerate = 30
-        
+    """Photographs the fridge on a schedule and uploads each shot to /fridge/image.
+
+    `monitor` is a coroutine: the next shot is captured on a worker thread
+    while the previous upload may still be in flight, and all uploads share
+    one aiohttp session. The interval shortens after the backend reports a
+    change and stretches while the fridge stays the same; failed shots back
+    off with jitter.
+    """
+
+    def __init__(self, camera=None, api_url=API_URL, fridge_id=FRIDGE_ID, interval=MONITOR_INTERVAL,
+                 active_interval=MONITOR_ACTIVE_INTERVAL, idle_interval=MONITOR_IDLE_INTERVAL,
+                 idle_growth=MONITOR_IDLE_GROWTH, backoff=MONITOR_BACKOFF, max_backoff=MONITOR_MAX_BACKOFF,
+                 timeout=UPLOAD_TIMEOUT):
+        if camera is None:
+            import picamera
+            camera = picamera.PiCamera()
+            camera.resolution = (640, 480)
+            camera.framerate = 30
+        self.camera = camera
+        self.api_url = api_url
+        self.fridge_id = fridge_id
+        self.interval = interval
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.idle_growth = idle_growth
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.next_interval = interval
+        self.failures = 0
+        self.counts = {"shots": 0, "uploaded": 0, "changed": 0, "unchanged": 0, "failed": 0}
+        self._stopped = asyncio.Event()
+        self._rescheduled = asyncio.Event()
+
     def capture_image(self):
         """Capture an image from the camera"""
         stream = io.BytesIO()
         self.camera.capture(stream, format='jpeg')
         stream.seek(0)
         return stream.getvalue()
-    
-    async def process_and_upload(self):
+
+    async def upload(self, session, image_data):
+        """Send one JPEG to /fridge/image and return the backend's reply"""
+        form = aiohttp.FormData()
+        form.add_field('file', image_data, filename=f"camera_{time.strftime('%Y%m%d-%H%M%S')}.jpg",
+                       content_type='image/jpeg')
+        form.add_field('fridge_id', self.fridge_id)
+        async with session.post(f"{self.api_url}/fridge/image", data=form) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def process_and_upload(self, session=None):
         """Capture image and send to API"""
-        image_data = self.capture_image()
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{API_URL}/fridge/image",
-                data=image_data
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                return None
-    
-    def start_monitoring(self, interval=3600):  # Default: check every hour
-        """Start continuous monitoring of the fridge"""
-        while True:
+        image_data = await asyncio.to_thread(self.capture_image)
+        if session is not None:
+            return await self.upload(session, image_data)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            return await self.upload(session, image_data)
+
+    def _schedule(self, interval):
+        self.next_interval = interval
+        self._rescheduled.set()
+
+    def _record(self, result):
+        """Pick the next interval from the backend's reply to an upload."""
+        self.failures = 0
+        self.counts["uploaded"] += 1
+        if result.get("status") == "no_change":
+            self.counts["unchanged"] += 1
+            self._schedule(min(max(self.next_interval, self.active_interval) * self.idle_growth, self.idle_interval))
+        else:
+            self.counts["changed"] += 1
+            self._schedule(self.active_interval)
+
+    def _fail(self, error):
+        self.failures += 1
+        self.counts["failed"] += 1
+        delay = min(self.backoff * 2 ** (self.failures - 1), self.max_backoff) * random.uniform(0.5, 1.5)
+        print(f"Error in camera monitoring: {error}, retrying in {delay:.1f}s")
+        self._schedule(delay)
+
+    async def _send(self, session, image_data):
+        try:
+            self._record(await self.upload(session, image_data))
+        except Exception as e:
+            self._fail(f"{type(e).__name__}: {e}")
+
+    async def _wait_until_due(self, started):
+        # An upload finishing mid-wait can move the next shot, so the deadline is recomputed
+        while not self._stopped.is_set():
+            remaining = started + self.next_interval - time.monotonic()
+            if remaining <= 0:
+                return
+            self._rescheduled.clear()
+            waiters = [asyncio.create_task(self._rescheduled.wait()), asyncio.create_task(self._stopped.wait())]
+            await asyncio.wait(waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+
+    async def monitor(self):
+        """Monitor the fridge until stop() is called"""
+        sending = None
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
             try:
-                self.process_and_upload()
-                time.sleep(interval)
-            except Exception as e:
-                print(f"Error in camera monitoring: {e}")
-                time.sleep(60)  # Wait a minute before retrying
-    
+                while not self._stopped.is_set():
+                    started = time.monotonic()
+                    try:
+                        image_data = await asyncio.to_thread(self.capture_image)
+                    except Exception as e:
+                        self._fail(f"capture failed: {e}")
+                    else:
+                        self.counts["shots"] += 1
+                        # At most one upload in flight, so shots reach the backend in order
+                        if sending:
+                            await sending
+                        sending = asyncio.create_task(self._send(session, image_data))
+                    await self._wait_until_due(started)
+                if sending:
+                    await sending
+            finally:
+                if sending and not sending.done():
+                    sending.cancel()
+
+    def stop(self):
+        self._stopped.set()
+
+    def start_monitoring(self):
+        """Start continuous monitoring of the fridge"""
+        try:
+            asyncio.run(self.monitor())
+        except KeyboardInterrupt:
+            print("Camera monitoring stopped")
+
     def __del__(self):
-        self.camera.close()
+        camera = getattr(self, 'camera', None)
+        if camera is not None:
+            camera.close()
 
 if __name__ == "__main__":
     camera = FridgeCamera()
-    camera.start_monitoring() 
\ No newline at end of file
+    camera.start_monitoring()
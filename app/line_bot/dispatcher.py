@@ -0,0 +1,126 @@
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+class DispatcherBusy(Exception):
+    pass
+
+class KeyedExecutor:
+    """Thread pool that runs tasks with the same key one at a time, in submission order.
+
+    Tasks with different keys run in parallel on up to `max_workers` threads.
+    At most `max_pending` tasks may be queued or running; submissions beyond
+    that are refused as a whole.
+    """
+
+    def __init__(self, max_workers=8, max_pending=1000):
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="keyed")
+        self._queues = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit_many(self, tasks):
+        """Queue (key, fn, args) tasks. Returns False, queuing none of them, if that would exceed max_pending."""
+        with self._lock:
+            if self._pending + len(tasks) > self.max_pending:
+                self.rejected += len(tasks)
+                return False
+            self._pending += len(tasks)
+            for key, fn, args in tasks:
+                queue = self._queues.get(key)
+                if queue is None:
+                    # No chain running for this key yet: start one
+                    self._queues[key] = collections.deque([(fn, args)])
+                    self._pool.submit(self._drain, key)
+                else:
+                    queue.append((fn, args))
+        return True
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                fn, args = queue[0]
+            try:
+                fn(*args)
+                failed = False
+            except Exception:
+                traceback.print_exc()
+                failed = True
+            with self._lock:
+                queue.popleft()
+                self._pending -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "active_keys": len(self._queues),
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+def event_key(event):
+    """Ordering key of a raw webhook event: the user, group or room it came from."""
+    source = event.get("source") or {}
+    for attr in ("userId", "groupId", "roomId"):
+        value = source.get(attr)
+        if value:
+            return value
+    return "anonymous"
+
+def sign(channel_secret, body):
+    """X-Line-Signature of a body, as LINE computes it."""
+    digest = hmac.new(channel_secret.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+class WebhookDispatcher:
+    """Verifies LINE webhook requests and runs them through the WebhookHandler in the background.
+
+    Events from the same user are handled in the order they arrived; events
+    from different users are handled concurrently. Each event is passed to
+    handler.handle on its own, as a one-event body signed with the channel
+    secret, so handlers are looked up and called exactly as the SDK does.
+    """
+
+    def __init__(self, handler, channel_secret, max_workers=8, max_pending=1000):
+        self.handler = handler
+        self.channel_secret = channel_secret
+        self.executor = KeyedExecutor(max_workers=max_workers, max_pending=max_pending)
+
+    def handle_event(self, body):
+        self.handler.handle(body, sign(self.channel_secret, body))
+
+    def dispatch(self, body, signature):
+        """Verify a webhook body, queue its events and return how many were queued.
+
+        Raises InvalidSignatureError for a bad signature and DispatcherBusy if
+        the backlog is full.
+        """
+        self.handler.parser.parse(body, signature)
+        request = json.loads(body)
+        tasks = []
+        for event in request.get("events", []):
+            event_body = json.dumps({"destination": request.get("destination"), "events": [event]})
+            tasks.append((event_key(event), self.handle_event, (event_body,)))
+        if not self.executor.submit_many(tasks):
+            raise DispatcherBusy(f"{len(tasks)} events refused, backlog is full")
+        return len(tasks)
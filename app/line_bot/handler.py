@@ -6,13 +6,15 @@ import os
 from dotenv import load_dotenv
 from ..services.fridge_service import get_fridge_status, add_food_item, remove_food_item, get_fridge_contents
 from ..services.recipe_service import get_recipe_suggestion
+from ..services.upload_service import save_chunks, UPLOAD_CHUNK_SIZE, MAX_IMAGE_UPLOAD_BYTES
+from ..services.capture_service import captures
+from ..services.command_service import command_channel
+from ..services.forwarder import Forwarder
 from ..database import get_db
 import logging
 from datetime import datetime, timedelta
 import subprocess
-import requests
 import json
-import time
 
 load_dotenv()
 
@@ -25,38 +27,25 @@ os.makedirs(STATIC_IMAGE_DIR, exist_ok=True)
 NGROK_URL_BASE = os.getenv('VITE_NGROK_URL_BASE', 'http://localhost:8000')
 WEBAPP_URL = f"{NGROK_URL_BASE}/liff/"
 PROCESSING_API_BASE = os.getenv('PROCESSING_API_BASE', 'https://2111-103-196-86-108.ngrok-free.app')
+# Device whose camera answers "take photo"; matches DEVICE_ID on the Pi
+CAMERA_DEVICE_ID = os.getenv('CAMERA_DEVICE_ID', 'default')
 
 # Dictionary to store selected items for each user
 user_selected_items = {}
 # Dictionary to store last recipe generation time for each user
 last_recipe_generation = {}
 
-def process_image(image_path):
-    """Process an image by sending it to the processing API without waiting for response"""
+# Photos are uploaded to the processing API in the background, over one pooled session
+forwarder = Forwarder(f"{PROCESSING_API_BASE}/process")
+
+def process_image(image_path, on_done=None):
+    """Queue an image for the processing API and return without waiting for the upload"""
     try:
-        print(f"[DEBUG] Starting to process image: {image_path}")
-        processing_url = f"{PROCESSING_API_BASE}/process"
-        print(f"[DEBUG] Processing URL: {processing_url}")
-        
-        print("[DEBUG] Opening image file...")
-        with open(image_path, 'rb') as image_file:
-            print("[DEBUG] File opened successfully")
-            files = {'file': image_file}
-            print("[DEBUG] Sending POST request to processing API (async)...")
-            
-            # Send request without waiting for response
-            result = requests.post(processing_url, files=files, timeout=1)
-            # print("[DEBUG] Request sent successfully")
-            print(f"[DEBUG] Response: {result.text}")
-            
-            return True, "Image sent for processing"
-            
-    except requests.exceptions.Timeout:
-        # Timeout is expected since we're not waiting for response
-        print("[DEBUG] Request sent (timeout expected)")
+        upload_id = forwarder.submit(image_path, on_done=on_done)
+        print(f"[DEBUG] Queued {image_path} for processing as {upload_id}")
         return True, "Image sent for processing"
     except Exception as e:
-        print(f"[DEBUG] Error sending request: {str(e)}")
+        print(f"[DEBUG] Error queueing image: {str(e)}")
         return False, f"Failed to send for processing: {str(e)}"
 
 # Helper to build a food card bubble for Flex Message
@@ -139,47 +128,38 @@ def build_food_bubble(food, webapp_url, is_selected=False):
         }
     }
 
+def send_capture_result(user_id, capture):
+    """Push the photo taken for a "take photo" request, or say that none arrived."""
+    if capture['status'] == 'completed':
+        image_url = f"{NGROK_URL_BASE}/static/images/{capture['filename']}"
+        line_bot_api.push_message(user_id, [
+            TextSendMessage(text="📸 Photo taken! Here's what I see:"),
+            ImageSendMessage(original_content_url=image_url, preview_image_url=image_url)
+        ])
+    elif capture['status'] == 'timeout':
+        line_bot_api.push_message(user_id, TextSendMessage(text="❌ The camera did not send a photo in time"))
+    # Failed triggers are already answered in the reply
+
 def handle_text_message(event):
     text = event.message.text.lower()
     db = next(get_db())
     try:
         if text == "take photo":
-            # Make the curl request to trigger photo
+            # The Pi uploads the photo with this capture id; send_capture_result pushes it to the user
+            user_id = event.source.user_id
+            capture_id = captures.create(
+                callback=lambda capture: send_capture_result(user_id, capture),
+                requested_by=user_id
+            )
             try:
-                rpi_api_base = os.getenv('RPI_API_BASE')
-                response = requests.get(f"{rpi_api_base}/trigger-photo")
-                if response.status_code == 200:
-                    # Wait a moment for the photo to be saved
-                    time.sleep(2)
-                    
-                    # Get the most recent photo from static/images
-                    image_files = [f for f in os.listdir(STATIC_IMAGE_DIR) if f.endswith('.jpg')]
-                    if image_files:
-                        # Sort by modification time (newest first)
-                        latest_image = max(image_files, key=lambda x: os.path.getmtime(os.path.join(STATIC_IMAGE_DIR, x)))
-                        
-                        # Send both text and image messages
-                        line_bot_api.reply_message(
-                            event.reply_token,
-                            [
-                                TextSendMessage(text="📸 Photo taken! Here's what I see:"),
-                                ImageSendMessage(
-                                    original_content_url=f"{NGROK_URL_BASE}/static/images/{latest_image}",
-                                    preview_image_url=f"{NGROK_URL_BASE}/static/images/{latest_image}"
-                                )
-                            ]
-                        )
-                    else:
-                        line_bot_api.reply_message(
-                            event.reply_token,
-                            TextSendMessage(text="📸 Photo request sent! Taking a photo...")
-                        )
-                else:
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TextSendMessage(text=f"❌ Failed to trigger photo: {response.status_code}")
-                    )
+                # The Pi long-polls its command queue and picks this up at once
+                command_channel.enqueue(CAMERA_DEVICE_ID, "take_photo", {"capture_id": capture_id})
+                line_bot_api.reply_message(
+                    event.reply_token,
+                    TextSendMessage(text="📸 Photo request sent! Taking a photo...")
+                )
             except Exception as e:
+                captures.fail(capture_id, str(e))
                 line_bot_api.reply_message(
                     event.reply_token,
                     TextSendMessage(text=f"❌ Error triggering photo: {str(e)}")
@@ -378,15 +358,13 @@ def handle_image_message(event):
     db = next(get_db())
     try:
         message_content = line_bot_api.get_message_content(event.message.id)
-        image_bytes = b"".join(chunk for chunk in message_content.iter_content(1024))
-        logging.info(f"[DEBUG] Received image of size: {len(image_bytes)} bytes")
-        # Save image to static/images with a unique filename
+        # Stream the content to static/images with a unique filename
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"line_{event.message.id}_{timestamp}.jpg"
         filepath = os.path.join(STATIC_IMAGE_DIR, filename)
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
-        
+        size, _ = save_chunks(message_content.iter_content(UPLOAD_CHUNK_SIZE), filepath, MAX_IMAGE_UPLOAD_BYTES, digest=False)
+        logging.info(f"[DEBUG] Received image of size: {size} bytes")
+
         # Process the image
         print(f"[DEBUG] Processing image: {filepath}")
         success, response_text = process_image(filepath)
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, File, UploadFile, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException, Depends, File, Form, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from linebot import LineBotApi, WebhookHandler
@@ -6,25 +6,31 @@ from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, ImageMessage
 import os
 from dotenv import load_dotenv
-from .line_bot.handler import handle_text_message, handle_image_message, process_image, handler
+from .line_bot.handler import handle_text_message, handle_image_message, handler, forwarder
+from .line_bot.dispatcher import WebhookDispatcher, DispatcherBusy
 from .models.database import Base
 from .database import engine, get_db
 from sqlalchemy.orm import Session
 import logging
 from datetime import datetime
 from .models.database import FoodItem
-from fastapi.responses import FileResponse
+from .services.labeling_service import update_food_items_from_images, label_cache
+from .services.recipe_service import recipe_cache, recipe_cache_key, cached_recipe, get_client as get_openai_client
+from .services.job_queue import JobQueue
+from .services.crop_store import sync_crop_dir, published_names
+from .services.frame_filter import FrameFilter
+from .services.capture_service import captures
+from .services.command_service import command_channel
+from .services.upload_service import save_upload, UploadTooLarge, UploadLimitMiddleware, MAX_IMAGE_UPLOAD_BYTES, MAX_ZIP_UPLOAD_BYTES
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
 import zipfile
 import shutil
 import json
 import requests
 import base64
 from pydantic import BaseModel
-from typing import List
-import openai
-
-# Global variable to track photo request state
-take_photo_requested = False
+from typing import List, Optional
 
 # Recipe-related models
 class IngredientsRequest(BaseModel):
@@ -63,24 +69,64 @@ STATIC_IMAGE_DIR = "/Users/hubert/NTU/Courses/WebLab/iFreeze/app/static/images"
 os.makedirs(STATIC_IMAGE_DIR, exist_ok=True)
 app.mount("/static/images", StaticFiles(directory=STATIC_IMAGE_DIR), name="static_images")
 
+# Per-object crops of the latest detection, named object_<temp_object_id>.<ext>.
+# A symlink to the current immutable version under ind_images_versions.
+IND_IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'static', 'ind_images')
+# The processing server can encode crops as PNG, JPEG or WebP
+CROP_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Longest a device command poll may wait before returning empty
+COMMAND_MAX_WAIT = float(os.getenv('COMMAND_MAX_WAIT', '30'))
+
+# Content hash of the last zip upload per fridge, to drop retransmissions
+last_uploads = {}
+# Last accepted diff per fridge: its job id and crop names, which can be carried over once it is applied
+pending_diffs = {}
+
+# Perceptual pre-filter for fridge photos, so unchanged frames skip detection
+frame_filter = FrameFilter()
+
+# Reject oversized uploads while the body streams in, before it is spooled
+UPLOAD_LIMITS = {
+    "/fridge/image": MAX_IMAGE_UPLOAD_BYTES,
+    "/upload/zip": MAX_ZIP_UPLOAD_BYTES,
+    "/upload/diff": MAX_ZIP_UPLOAD_BYTES,
+}
+app.add_middleware(UploadLimitMiddleware, limits=UPLOAD_LIMITS)
+
 # LINE Bot setup
 line_bot_api = LineBotApi(os.getenv('LINE_CHANNEL_ACCESS_TOKEN'))
+# Webhook events are handled in the background, in order per user
+webhook_dispatcher = WebhookDispatcher(
+    handler,
+    os.getenv('LINE_CHANNEL_SECRET'),
+    max_workers=int(os.getenv('WEBHOOK_WORKERS', '8')),
+    max_pending=int(os.getenv('WEBHOOK_MAX_PENDING', '1000'))
+)
 
 @app.post("/webhook")
 async def line_webhook(request: Request):
     signature = request.headers.get("X-Line-Signature", "")
     body = await request.body()
     print("[WEBHOOK] Received body:", body)
+    # Acknowledge right away; the handlers run on webhook_dispatcher's threads
     try:
-        handler.handle(body.decode(), signature)
+        events = webhook_dispatcher.dispatch(body.decode(), signature)
     except InvalidSignatureError:
         print("[WEBHOOK] Invalid signature error")
         return {"status": "invalid signature"}
+    except DispatcherBusy as e:
+        print("[WEBHOOK] Busy:", e)
+        return JSONResponse(status_code=503, content={"status": "busy"})
     except Exception as e:
         print("[WEBHOOK] Exception:", e)
         print("[WEBHOOK] Raw body:", body)
         return {"status": "error", "error": str(e)}
-    return {"status": "ok"}
+    return {"status": "ok", "events": events}
+
+@app.get("/webhook/stats")
+async def webhook_stats():
+    return webhook_dispatcher.executor.stats()
 
 @handler.add(MessageEvent, message=TextMessage)
 def handle_text(event):
@@ -120,213 +166,316 @@ async def get_foods(db: Session = Depends(get_db)):
     ]
 
 @app.post("/fridge/image")
-async def process_fridge_image(file: UploadFile = File(...)):
+async def process_fridge_image(file: UploadFile = File(...), fridge_id: str = Form("default"), force: bool = Form(False),
+                               capture_id: str = Form(None)):
     try:
-        # Read the uploaded file
-        image_bytes = await file.read()
-        logging.info(f"[DEBUG] Received file: {file.filename}, size: {len(image_bytes)} bytes, content_type: {file.content_type}")
-        
         # Save image to static/images with timestamp like LINE bot does
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"api_{timestamp}_{file.filename}" if file.filename else f"api_{timestamp}.jpg"
         filepath = os.path.join(STATIC_IMAGE_DIR, filename)
-        
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
-        
-        logging.info(f"[DEBUG] Image saved to: {filepath}")
-        
-        # Process the image using the same pipeline as LINE bot
-        success, response_text = process_image(filepath)
-        logging.info(f"[DEBUG] Image processing result: {success}, Response: {response_text}")
-        
-        if success:
-            return {
-                "status": "success", 
-                "message": "Image uploaded and sent for processing",
-                "filename": filename,
-                "processing_response": response_text
-            }
-        else:
+        try:
+            size, _ = await save_upload(file, filepath, MAX_IMAGE_UPLOAD_BYTES, digest=False)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        logging.info(f"[DEBUG] Received file: {file.filename}, size: {size} bytes, content_type: {file.content_type}")
+
+        # The photo answers a capture request (e.g. "take photo" in the LINE bot)
+        if capture_id and not await run_in_threadpool(captures.complete, capture_id, filename):
+            logging.info(f"[DEBUG] Capture {capture_id} is unknown or already finished")
+
+        # Skip detection when the fridge looks the same as in the last processed frame
+        forward, difference = await run_in_threadpool(frame_filter.check, fridge_id, filepath, force)
+        if not forward:
+            # A requested photo is still shown to the user
+            if not capture_id:
+                os.remove(filepath)
+            logging.info(f"[DEBUG] Frame unchanged for fridge {fridge_id}: {difference:.4f} of cells differ")
             return {
-                "status": "partial_success",
-                "message": f"Image saved but processing failed: {response_text}",
-                "filename": filename
+                "status": "no_change",
+                "message": "Image matches the last processed frame, not reprocessed",
+                "difference": difference
             }
-            
+
+        logging.info(f"[DEBUG] Image saved to: {filepath}")
+
+        # Process the image using the same pipeline as LINE bot
+        def forwarded(upload):
+            # The photo never reached detection, so it must not become the reference frame
+            if upload['status'] == 'dead':
+                frame_filter.forget(fridge_id)
+            # A dead upload delivered by a retry is the reference again, if no newer frame took over
+            elif upload['status'] == 'delivered':
+                frame_filter.restore(fridge_id, upload['path'])
+
+        # Queued for the processing API; the upload can be followed at /forwarding/{upload_id}
+        upload_id = forwarder.submit(filepath, on_done=forwarded)
+        logging.info(f"[DEBUG] Image queued for processing as {upload_id}")
+        return {
+            "status": "success",
+            "message": "Image uploaded and sent for processing",
+            "filename": filename,
+            "upload_id": upload_id
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"[ERROR] Error processing image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
-# Helper function to process the uploaded zip file
-# This function will be run in the background
+# Ingest runs on the durable job queue: each upload becomes a job whose stages
+# are recorded in the jobs table, so it survives restarts and can be retried.
+job_queue = JobQueue(workers=int(os.getenv('JOB_WORKERS', '2')))
 
-def process_zip_file(zip_path):
-    import time
-    from app.models.database import FoodItem, Base
-    from app.database import SessionLocal
-    
+def unpack_zip_stage(payload, db):
+    """Fallback ingest path: unpack a zip of the processing server's result directory."""
+    zip_path = payload['zip_path']
     # 1. Unzip the file to a temp directory
     temp_dir = zip_path + "_unzipped"
     os.makedirs(temp_dir, exist_ok=True)
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-
-    # 2. Load JSON files from the 'json' subdirectory
-    def load_json(filename):
-        with open(os.path.join(temp_dir, 'json', filename), 'r') as f:
-            return json.load(f)
     try:
-        old_json = load_json('old.json')
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(temp_dir)
+
+        # 2. Load JSON files from the 'json' subdirectory
+        def load_json(filename):
+            with open(os.path.join(temp_dir, 'json', filename), 'r') as f:
+                return json.load(f)
         new_json = load_json('new.json')
-        match_json = load_json('match.json')
-        delete_json = load_json('delete.json')
-        add_json = load_json('add.json')
-    except Exception as e:
-        print(f"[ERROR] Failed to load JSONs: {e}")
-        shutil.rmtree(temp_dir)
-        return
 
-    # 3. Open DB session
-    db = SessionLocal()
-    try:
-        # 4. Delete items in delete.json
-        for entry in delete_json:
-            old_id = entry['old_object_id']
-            item = db.query(FoodItem).filter(FoodItem.temp_object_id == old_id).first()
-            if item:
-                db.delete(item)
-        db.commit()
-
-        # 5. Update matched items (change temp_object_id)
-        for entry in match_json:
-            old_id = entry['old_object_id']
-            new_id = entry['new_object_id']
-            item = db.query(FoodItem).filter(FoodItem.temp_object_id == old_id).first()
-            if item:
-                item.temp_object_id = new_id
-        db.commit()
-
-        # 6. Add new items from add.json
-        for entry in add_json:
-            new_id = entry['new_object_id']
-            # You may want to extract more info from new_json (like bounding_box, image_path)
-            # For now, just add with temp_object_id
-            new_item = FoodItem(temp_object_id=new_id, name=f"Object {new_id}", category="unknown", status="fresh")
-            db.add(new_item)
-        db.commit()
+        # Read the crops of all current objects before the temp dir is removed
+        crops = {}
+        for obj in new_json:
+            name = os.path.basename(obj['image_path'])
+            img_src = os.path.join(temp_dir, name)
+            if os.path.exists(img_src):
+                with open(img_src, 'rb') as f:
+                    crops[name] = base64.b64encode(f.read()).decode('ascii')
+        return {
+            'new': new_json,
+            'match': load_json('match.json'),
+            'delete': load_json('delete.json'),
+            'add': load_json('add.json'),
+            'crops': crops
+        }
     finally:
-        db.close()
-
-    # 7. Update images in static/ind_images
-    IND_IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'static', 'ind_images')
-    # Remove all existing images
-    for f in os.listdir(IND_IMAGES_DIR):
-        file_path = os.path.join(IND_IMAGES_DIR, f)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
-    # Copy images for all current items (based on new_json)
+        # Clean up temp dir
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def reconcile_stage(payload, db):
+    """Delete, renumber and add items; committed by the queue with the stage record."""
+    from app.services.fridge_service import reconcile_detection_diff
+    reconcile_detection_diff(db, payload['match'], payload['delete'], payload['add'])
+
+def images_stage(payload, db):
+    """Update images in static/ind_images, then drop the crops from the stored payload."""
+    crops = {name: base64.b64decode(data) for name, data in payload.get('crops', {}).items()}
+    update_ind_images(payload['new'], payload['match'], crops)
+    return {key: value for key, value in payload.items() if key != 'crops'}
+
+def labels_stage(payload, db):
+    """Label the diff's new objects, re-sent crops and items still unlabeled; matched items keep their names."""
+    ids = {entry['new_object_id'] for entry in payload['add']}
+    ids.update(payload.get('resent', []))
+    # Items whose earlier labeling failed still have the placeholder category
+    matched = [entry['new_object_id'] for entry in payload['match']]
+    if matched:
+        ids.update(row.temp_object_id for row in db.query(FoodItem.temp_object_id).filter(
+            FoodItem.temp_object_id.in_(matched),
+            FoodItem.category == "unknown"
+        ))
+    update_food_items_from_images(IND_IMAGES_DIR, CROP_EXTENSIONS, temp_object_ids=ids)
+
+job_queue.register("zip", [
+    ("unpack", unpack_zip_stage),
+    ("reconcile", reconcile_stage),
+    ("images", images_stage),
+    ("labels", labels_stage),
+])
+job_queue.register("diff", [
+    ("reconcile", reconcile_stage),
+    ("images", images_stage),
+    ("labels", labels_stage),
+])
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+
+@app.on_event("startup")
+async def start_forwarder():
+    forwarder.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    job_queue.stop()
+
+def carried_crops(new_json, match_json, crops):
+    """{name: previous name} for the current items whose crop is not in `crops` and moves from a matched object."""
+    # Matched objects are renumbered, so their previous crop moves to the new id
+    new_to_old = {entry['new_object_id']: entry['old_object_id'] for entry in match_json}
+    carried = {}
     for obj in new_json:
-        img_src = os.path.join(temp_dir, os.path.basename(obj['image_path']))
-        img_dst = os.path.join(IND_IMAGES_DIR, os.path.basename(obj['image_path']))
-        if os.path.exists(img_src):
-            shutil.copy(img_src, img_dst)
-
-    # 8. Clean up temp dir
-    shutil.rmtree(temp_dir)
-
-    # 9. Analyze images and update FoodItem info
-    update_food_items_from_images()
-
-def analyze_image_with_openai(image_path):
-    from dotenv import load_dotenv
-    from openai import OpenAI
-    load_dotenv()
-    ngrok_base = os.getenv('VITE_NGROK_URL_BASE')
-    api_key = os.getenv('OPENAI_API_KEY')
-    print(f"apikey:{api_key}")
-    client = OpenAI(api_key=api_key)
-    filename = os.path.basename(image_path)
-    image_url = f"{ngrok_base}/static/ind_images/{filename}"
-    
-    try:
-        response = client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {"role": "user", "content": "Analyze the image and list all visible food items, their estimated category, expiry date (if possible), and whether they look fresh, spoiling, or spoiled. Return your answer as a JSON object with keys: name, category, expiry_date, status. If you don't know expiry_date, return null."},
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_image", 
-                            "image_url": image_url
-                        }
-                    ]
-                }
-            ]
-        )
-        content = response.output_text
-        import json as pyjson
-        start = content.find('{')
-        end = content.rfind('}') + 1
-        json_str = content[start:end]
-        return pyjson.loads(json_str)
-    except Exception as e:
-        print(f"[ERROR] OpenAI API call failed or response parsing failed: {e}")
-        return None
-
-def update_food_items_from_images():
-    IND_IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'static', 'ind_images')
-    from app.models.database import FoodItem
-    from app.database import SessionLocal
-    db = SessionLocal()
-    try:
-        for filename in os.listdir(IND_IMAGES_DIR):
-            if filename.endswith('.png'):
-                try:
-                    temp_object_id = int(filename.split('_')[1].split('.')[0])  # e.g., object_3.png → 3
-                except Exception as e:
-                    print(f"[ERROR] Could not parse temp_object_id from {filename}: {e}")
-                    continue
-                image_path = os.path.join(IND_IMAGES_DIR, filename)
-                food_info = analyze_image_with_openai(image_path)
-                item = db.query(FoodItem).filter(FoodItem.temp_object_id == temp_object_id).first()
-                if item and food_info:
-                    item.name = food_info.get('name', item.name)
-                    item.category = food_info.get('category', item.category)
-                    item.status = food_info.get('status', item.status)
-                    expiry = food_info.get('expiry_date')
-                    if expiry:
-                        from datetime import datetime
-                        try:
-                            item.expiry_date = datetime.fromisoformat(expiry)
-                        except Exception:
-                            item.expiry_date = None
-            db.commit()
-    finally:
-        db.close()
+        name = os.path.basename(obj['image_path'])
+        if name not in crops and obj['object_id'] in new_to_old:
+            ext = os.path.splitext(name)[1]
+            carried[name] = f"object_{new_to_old[obj['object_id']]}{ext}"
+    return carried
+
+def update_ind_images(new_json, match_json, crops):
+    """Publish the crops of all current items (based on new_json) to static/ind_images."""
+    carried = carried_crops(new_json, match_json, crops)
+    published = published_names(IND_IMAGES_DIR)
+    lost = sorted(name for name, old_name in carried.items() if old_name not in published)
+    if lost:
+        logging.error(f"[ERROR] No crop to carry over for {lost}; these items are published without an image")
+    stats = sync_crop_dir(IND_IMAGES_DIR, crops, carried)
+    print(f"[INFO] Crops synced: {stats['written']} written ({stats['bytes_written']} bytes), "
+          f"{stats['linked']} unchanged, {stats['removed']} removed")
 
 @app.post("/upload/zip")
-async def upload_zip(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_zip(file: UploadFile = File(...), fridge_id: str = Form("default")):
     if not file.filename.endswith('.zip'):
         raise HTTPException(status_code=400, detail="Only .zip files are allowed")
     ZIP_DIR = os.path.join(os.path.dirname(__file__), 'static', 'zips')
     os.makedirs(ZIP_DIR, exist_ok=True)
-    file_bytes = await file.read()
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"upload_{timestamp}_{file.filename}"
     filepath = os.path.join(ZIP_DIR, filename)
-    with open(filepath, 'wb') as f:
-        f.write(file_bytes)
-    # Add background task for processing
-    background_tasks.add_task(process_zip_file, filepath)
+    try:
+        size, digest = await save_upload(file, filepath, MAX_ZIP_UPLOAD_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    # A retried upload of the same result is already queued
+    duplicate_of = last_uploads.get(('zip', fridge_id))
+    if duplicate_of and duplicate_of['sha256'] == digest:
+        os.remove(filepath)
+        return {
+            "status": "duplicate",
+            "message": "Zip identical to the previous upload, not reprocessed",
+            "filename": duplicate_of['filename'],
+            "size": size,
+            "job_id": duplicate_of['job_id']
+        }
+    job_id = job_queue.submit("zip", {'zip_path': filepath}, fridge_id=fridge_id)
+    last_uploads[('zip', fridge_id)] = {'sha256': digest, 'filename': filename, 'job_id': job_id}
     return {
         "status": "success",
         "message": f"File uploaded successfully",
         "filename": filename,
-        "size": len(file_bytes)
+        "size": size,
+        "job_id": job_id
+    }
+
+@app.post("/upload/diff")
+async def upload_diff(manifest: str = Form(...), crops: List[UploadFile] = File(default=[]), fridge_id: str = Form("default")):
+    """Direct ingest from the processing server: a JSON diff plus only the new crops."""
+    try:
+        diff = json.loads(manifest)
+        payload = {key: diff[key] for key in ('new', 'match', 'delete', 'add')}
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid manifest: {e}")
+    crop_data = {}
+    for crop in crops:
+        crop_data[os.path.basename(crop.filename)] = await crop.read()
+
+    # Matched objects reuse the crop the backend has. Ask for any that it does not have:
+    # lost in a restart or a failed diff, or stored under another extension (CROP_FORMAT changed).
+    available = published_names(IND_IMAGES_DIR)
+    pending = pending_diffs.get(fridge_id)
+    if pending:
+        job = job_queue.get(pending['job_id'])
+        if job and job['status'] in ('queued', 'running'):
+            available = available | pending['crops']
+    carried = carried_crops(payload['new'], payload['match'], crop_data)
+    missing = sorted(name for name, old_name in carried.items() if old_name not in available)
+    if missing:
+        return {
+            "status": "missing_crops",
+            "message": "Resend the diff with these crops",
+            "missing": missing
+        }
+    # Crops of matched objects were re-sent because the old ones were lost; they are labeled again
+    added_ids = {entry['new_object_id'] for entry in payload['add']}
+    payload['resent'] = [
+        obj['object_id'] for obj in payload['new']
+        if obj['object_id'] not in added_ids and os.path.basename(obj['image_path']) in crop_data
+    ]
+
+    payload['crops'] = {name: base64.b64encode(data).decode('ascii') for name, data in crop_data.items()}
+    job_id = job_queue.submit("diff", payload, fridge_id=fridge_id)
+    pending_diffs[fridge_id] = {
+        'job_id': job_id,
+        'crops': {os.path.basename(obj['image_path']) for obj in payload['new']}
+    }
+    return {
+        "status": "success",
+        "message": "Diff received",
+        "objects": len(payload['new']),
+        "crops": len(crop_data),
+        "size": len(manifest) + sum(len(data) for data in crop_data.values()),
+        "job_id": job_id
     }
 
+@app.get("/jobs")
+async def list_jobs(fridge_id: str = None, status: str = None, limit: int = 50):
+    return job_queue.list(fridge_id=fridge_id, status=status, limit=limit)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: int):
+    if not job_queue.retry(job_id):
+        raise HTTPException(status_code=409, detail="Only failed jobs with no newer finished job can be retried")
+    return job_queue.get(job_id)
+
+@app.post("/jobs/{job_id}/discard")
+async def discard_job(job_id: int):
+    if not job_queue.discard(job_id):
+        raise HTTPException(status_code=409, detail="Only failed jobs can be discarded")
+    return job_queue.get(job_id)
+
+@app.get("/forwarding")
+async def forwarding_status():
+    return {**forwarder.stats(), "dead_letters": forwarder.dead_letters()}
+
+@app.get("/forwarding/{upload_id}")
+async def get_forwarded_upload(upload_id: str):
+    upload = forwarder.get(upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+@app.post("/forwarding/{upload_id}/retry")
+async def retry_forwarded_upload(upload_id: str):
+    if not forwarder.retry(upload_id):
+        raise HTTPException(status_code=409, detail="Only dead uploads can be retried")
+    return forwarder.get(upload_id)
+
+@app.get("/captures/{capture_id}")
+async def get_capture(capture_id: str):
+    capture = await run_in_threadpool(captures.get, capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return capture
+
+@app.get("/fridge/frames/stats")
+async def frame_filter_stats():
+    return frame_filter.stats()
+
+@app.get("/labels/cache")
+async def label_cache_stats():
+    return label_cache.stats()
+
+@app.get("/recipes/cache")
+async def recipe_cache_stats():
+    return recipe_cache.stats()
+
 @app.get("/static/images/{filename}")
 async def get_image(filename: str):
     image_path = os.path.join(STATIC_IMAGE_DIR, filename)
@@ -348,19 +497,32 @@ async def list_images():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class DeviceCommandRequest(BaseModel):
+    command: str
+    payload: Optional[dict] = None
+
+@app.post("/devices/{device_id}/commands")
+async def queue_device_command(device_id: str, request: DeviceCommandRequest):
+    command_id = await run_in_threadpool(command_channel.enqueue, device_id, request.command, request.payload)
+    return {"status": "success", "id": command_id}
+
+@app.get("/devices/{device_id}/commands")
+async def poll_device_commands(device_id: str, wait: float = 0, limit: int = 10):
+    """Long-poll: returns as soon as the device has commands, or empty after `wait` seconds."""
+    commands = await command_channel.wait(device_id, min(wait, COMMAND_MAX_WAIT), limit=limit)
+    return {"status": "success", "commands": commands}
+
+# Kept for existing devices; both act on the "default" device's take_photo commands
 @app.post("/api/set-take-photo")
 async def set_take_photo():
-    global take_photo_requested
-    take_photo_requested = True
+    await run_in_threadpool(command_channel.enqueue, "default", "take_photo")
     return {"status": "success", "message": "Photo request set to true"}
 
 @app.get("/api/check-take-photo")
-async def check_take_photo():
-    global take_photo_requested
-    if take_photo_requested:
-        take_photo_requested = False  # Reset the flag after checking
-        return {"status": "success", "take_photo": True}
-    return {"status": "success", "take_photo": False}
+async def check_take_photo(wait: float = 0):
+    # Requests queued since the last check are coalesced into one photo
+    commands = await command_channel.wait("default", min(wait, COMMAND_MAX_WAIT), command="take_photo", limit=100)
+    return {"status": "success", "take_photo": bool(commands)}
 
 # @app.post("/upload/image")
 # async def upload_image(file: UploadFile = File(...)):
@@ -394,8 +556,7 @@ async def check_take_photo():
 
 @app.get("/static/ind_images/{filename}")
 async def get_ind_image(filename: str):
-    ind_images_dir = os.path.join(os.path.dirname(__file__), 'static', 'ind_images')
-    image_path = os.path.join(ind_images_dir, filename)
+    image_path = os.path.join(IND_IMAGES_DIR, filename)
     if not os.path.exists(image_path):
         raise HTTPException(status_code=404, detail=f"Image not found: {filename}")
     return FileResponse(image_path)
@@ -439,30 +600,33 @@ recipe_schema = {
     "additionalProperties": False
 }
 
+RECIPE_SEARCH_MODEL = os.getenv('RECIPE_SEARCH_MODEL', 'gpt-4o-mini')
+RECIPE_SEARCH_PROMPT = "Create a recipe that uses these ingredients: {ingredients}. Provide a recipe with title, URL (use 'N/A' if not from a specific source), summary, complete ingredient list, and detailed step-by-step instructions."
+
 def find_recipe_with_web_search(ingredients: List[str]):
-    api_key = os.getenv('OPENAI_API_KEY')
-    client = openai.OpenAI(api_key=api_key)
-    
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",  # Using gpt-4o-mini instead of gpt-4o-search-preview
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that creates recipes based on given ingredients. You must return structured JSON data."},
-            {"role": "user", "content": f"Create a recipe that uses these ingredients: {', '.join(ingredients)}. Provide a recipe with title, URL (use 'N/A' if not from a specific source), summary, complete ingredient list, and detailed step-by-step instructions."}
-        ],
-        response_format={
-            "type": "json_schema",
-            "json_schema": {
-                "name": "recipe_response",
-                "schema": recipe_schema
+    def generate():
+        response = get_openai_client().chat.completions.create(
+            model=RECIPE_SEARCH_MODEL,  # Using gpt-4o-mini instead of gpt-4o-search-preview
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant that creates recipes based on given ingredients. You must return structured JSON data."},
+                {"role": "user", "content": RECIPE_SEARCH_PROMPT.format(ingredients=', '.join(ingredients))}
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "recipe_response",
+                    "schema": recipe_schema
+                }
             }
-        }
-    )
-    
-    # Parse the structured JSON response
-    content = response.choices[0].message.content
-    recipe_data = json.loads(content)
-    
-    return recipe_data
+        )
+
+        # Parse the structured JSON response
+        content = response.choices[0].message.content
+        return json.loads(content)
+
+    # The same ingredient set, in any order or case, is answered from the recipe cache
+    key = recipe_cache_key("search", RECIPE_SEARCH_MODEL, RECIPE_SEARCH_PROMPT, [(name, None) for name in ingredients])
+    return cached_recipe(key, generate)
 
 @app.post("/find_recipe", response_model=RecipeSummaryResponse)
 def find_recipe(request: IngredientsRequest):
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, ForeignKey, Boolean, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -22,4 +22,53 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     line_user_id = Column(String, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    last_interaction = Column(DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    last_interaction = Column(DateTime, default=datetime.utcnow) 
+
+class CacheEntry(Base):
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String, primary_key=True)  # e.g. "labels"
+    key = Column(String, primary_key=True)
+    value = Column(Text)  # JSON-encoded
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    fridge_id = Column(String, index=True, default="default")
+    kind = Column(String)  # which stage list to run, e.g. "zip" or "diff"
+    payload = Column(Text)  # JSON, rewritten as stages complete
+    status = Column(String, index=True, default="queued")  # queued, running, done, failed
+    stage = Column(String, nullable=True)  # last completed stage
+    progress = Column(Float, default=0.0)
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    worker = Column(String, nullable=True)  # host:pid of the worker running it
+    run_after = Column(DateTime, nullable=True)  # retry backoff
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class DeviceCommand(Base):
+    __tablename__ = "device_commands"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, index=True)
+    command = Column(String)  # e.g. "take_photo"
+    payload = Column(Text, nullable=True)  # JSON
+    status = Column(String, index=True, default="queued")  # queued, delivered
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+
+class Capture(Base):
+    __tablename__ = "captures"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, index=True, default="pending")  # pending, completed, failed, timeout
+    filename = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    info = Column(Text, nullable=True)  # JSON, e.g. who requested it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime)
+    completed_at = Column(DateTime, nullable=True)
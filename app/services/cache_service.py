@@ -0,0 +1,124 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from ..database import SessionLocal
+from ..models.database import CacheEntry
+
+class PersistentCache:
+    """JSON value cache stored in the cache_entries table, so it survives restarts.
+
+    Entries older than `ttl_seconds` are treated as misses and removed. When a
+    namespace holds more than `max_entries`, the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, namespace, ttl_seconds, max_entries):
+        self.namespace = namespace
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, count=True):
+        """Return the cached value for key, or None on a miss."""
+        return self.get_many([key], count).get(key)
+
+    def get_many(self, keys, count=True):
+        """Look up several keys in one query, returning {key: value} for the hits.
+
+        With count=False the lookup is left out of the hit and miss counts.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            entries = db.query(CacheEntry).filter(
+                CacheEntry.namespace == self.namespace,
+                CacheEntry.key.in_(keys)
+            ).all()
+            found = {}
+            for entry in entries:
+                if now - entry.created_at > self.ttl:
+                    db.delete(entry)
+                    continue
+                entry.last_used = now
+                found[entry.key] = json.loads(entry.value)
+            db.commit()
+        finally:
+            db.close()
+        if count:
+            for key in keys:
+                self._count(key in found)
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        if not values:
+            return
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            for key, value in values.items():
+                db.merge(CacheEntry(
+                    namespace=self.namespace,
+                    key=key,
+                    value=json.dumps(value),
+                    created_at=now,
+                    last_used=now
+                ))
+            db.flush()
+            self._evict(db)
+            db.commit()
+        finally:
+            db.close()
+
+    def _evict(self, db):
+        query = db.query(CacheEntry).filter(CacheEntry.namespace == self.namespace)
+        excess = query.count() - self.max_entries
+        if excess <= 0:
+            return
+        oldest = query.order_by(CacheEntry.last_used.asc()).limit(excess).all()
+        for entry in oldest:
+            db.delete(entry)
+        with self._lock:
+            self.evictions += len(oldest)
+
+    def clear(self):
+        db = SessionLocal()
+        try:
+            db.query(CacheEntry).filter(CacheEntry.namespace == self.namespace).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self):
+        db = SessionLocal()
+        try:
+            size = db.query(CacheEntry).filter(CacheEntry.namespace == self.namespace).count()
+        finally:
+            db.close()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "size": size,
+                "max_entries": self.max_entries,
+                "ttl_seconds": int(self.ttl.total_seconds()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
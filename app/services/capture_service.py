@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from ..database import SessionLocal
+from ..models.database import Capture
+
+CAPTURE_TIMEOUT = float(os.getenv('CAPTURE_TIMEOUT', '20'))
+# The creating worker rechecks its pending captures this often, to see uploads received by other workers
+CAPTURE_POLL_INTERVAL = float(os.getenv('CAPTURE_POLL_INTERVAL', '0.5'))
+
+class CaptureRegistry:
+    """Photo requests that are completed by the upload carrying their id.
+
+    Captures live in the captures table, so the upload may reach any server
+    worker. `create` returns a capture id to send along with the trigger.
+    When the photo arrives, `complete` is called with its filename; finishing
+    a capture is a conditional UPDATE, so it happens exactly once. The worker
+    that created a capture watches its row and runs the callback with the
+    finished capture, or with status "timeout" if no photo arrived in time.
+    Callbacks run on a small pool, so neither the uploader nor the requester
+    blocks on them.
+    """
+
+    def __init__(self, timeout=CAPTURE_TIMEOUT, keep_seconds=3600, poll_interval=CAPTURE_POLL_INTERVAL):
+        self.timeout = timeout
+        self.keep_seconds = keep_seconds
+        self.poll_interval = poll_interval
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._watcher = None
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="capture")
+
+    def create(self, callback=None, timeout=None, **info):
+        capture_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            # Finished captures are only kept for inspection
+            db.query(Capture).filter(
+                Capture.status != "pending",
+                Capture.completed_at < now - timedelta(seconds=self.keep_seconds)
+            ).delete(synchronize_session=False)
+            db.add(Capture(
+                id=capture_id,
+                status="pending",
+                info=json.dumps(info),
+                created_at=now,
+                expires_at=now + timedelta(seconds=timeout or self.timeout)
+            ))
+            db.commit()
+        finally:
+            db.close()
+        if callback:
+            with self._lock:
+                self._callbacks[capture_id] = callback
+                if self._watcher is None:
+                    self._watcher = threading.Thread(target=self._watch, daemon=True, name="capture-watcher")
+                    self._watcher.start()
+        return capture_id
+
+    def complete(self, capture_id, filename):
+        """Attach the uploaded photo to a capture. Returns False if it is unknown, finished or expired."""
+        return self._finish(capture_id, "completed", filename=filename)
+
+    def fail(self, capture_id, error):
+        return self._finish(capture_id, "failed", error=error)
+
+    def get(self, capture_id):
+        db = SessionLocal()
+        try:
+            capture = db.query(Capture).filter(Capture.id == capture_id).first()
+            return self._describe(capture) if capture else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _describe(capture):
+        return {
+            "id": capture.id,
+            "status": capture.status,
+            "filename": capture.filename,
+            "error": capture.error,
+            "created_at": capture.created_at.isoformat() if capture.created_at else None,
+            "completed_at": capture.completed_at.isoformat() if capture.completed_at else None,
+            **json.loads(capture.info or "{}"),
+        }
+
+    def _finish(self, capture_id, status, **fields):
+        now = datetime.utcnow()
+        query_filter = [Capture.id == capture_id, Capture.status == "pending"]
+        if status != "timeout":
+            # A photo arriving after the deadline does not revive the capture
+            query_filter.append(Capture.expires_at > now)
+        db = SessionLocal()
+        try:
+            updated = db.query(Capture).filter(*query_filter).update(
+                {"status": status, "completed_at": now, **fields}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+        if updated:
+            # Callbacks of this process run at once; other workers see the row on their next check
+            self._wakeup.set()
+        return bool(updated)
+
+    def _watch(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                ids = list(self._callbacks)
+            if not ids:
+                continue
+            try:
+                self._check(ids)
+            except Exception as e:
+                print(f"[capture] Watching captures failed: {e}")
+
+    def _check(self, ids):
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            captures = db.query(Capture).filter(Capture.id.in_(ids)).all()
+            expired = [c.id for c in captures if c.status == "pending" and c.expires_at <= now]
+        finally:
+            db.close()
+        for capture_id in expired:
+            self._finish(capture_id, "timeout")
+        if expired:
+            db = SessionLocal()
+            try:
+                captures = db.query(Capture).filter(Capture.id.in_(ids)).all()
+            finally:
+                db.close()
+        for capture in captures:
+            if capture.status == "pending":
+                continue
+            with self._lock:
+                callback = self._callbacks.pop(capture.id, None)
+            if callback:
+                self._pool.submit(self._run_callback, callback, self._describe(capture))
+        # A capture whose row is gone (pruned or never stored) will not finish
+        found = {capture.id for capture in captures}
+        with self._lock:
+            for capture_id in set(ids) - found:
+                self._callbacks.pop(capture_id, None)
+
+    @staticmethod
+    def _run_callback(callback, capture):
+        try:
+            callback(capture)
+        except Exception as e:
+            print(f"[capture] Callback for {capture['id']} failed: {e}")
+
+captures = CaptureRegistry()
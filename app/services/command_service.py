@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+from ..database import SessionLocal
+from ..models.database import DeviceCommand
+
+# Waiting long-polls recheck the database this often, to see commands queued by other workers
+COMMAND_DB_POLL_INTERVAL = float(os.getenv('COMMAND_DB_POLL_INTERVAL', '0.5'))
+COMMAND_KEEP_DAYS = int(os.getenv('COMMAND_KEEP_DAYS', '1'))
+
+class CommandChannel:
+    """Per-device command queue in the device_commands table, delivered by long-polling.
+
+    A command is handed to exactly one poll, even with several server
+    workers. Polls waiting in the process that queued the command wake
+    immediately; polls in other workers see it on their next database check.
+    """
+
+    def __init__(self, db_poll_interval=COMMAND_DB_POLL_INTERVAL):
+        self.db_poll_interval = db_poll_interval
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, device_id, command, payload=None):
+        db = SessionLocal()
+        try:
+            entry = DeviceCommand(
+                device_id=device_id,
+                command=command,
+                payload=json.dumps(payload) if payload is not None else None
+            )
+            db.add(entry)
+            # Delivered commands are only kept for inspection
+            cutoff = datetime.utcnow() - timedelta(days=COMMAND_KEEP_DAYS)
+            db.query(DeviceCommand).filter(
+                DeviceCommand.status == "delivered",
+                DeviceCommand.delivered_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+            command_id = entry.id
+        finally:
+            db.close()
+        self._notify(device_id)
+        return command_id
+
+    def claim(self, device_id, command=None, limit=10):
+        """Mark up to `limit` queued commands of a device as delivered and return them, oldest first."""
+        db = SessionLocal()
+        try:
+            query = db.query(DeviceCommand.id).filter(
+                DeviceCommand.device_id == device_id,
+                DeviceCommand.status == "queued"
+            )
+            if command:
+                query = query.filter(DeviceCommand.command == command)
+            ids = [row.id for row in query.order_by(DeviceCommand.id).limit(limit)]
+            now = datetime.utcnow()
+            claimed = []
+            for command_id in ids:
+                # Another worker may claim the same row; only the update that changes it wins
+                updated = db.query(DeviceCommand).filter(
+                    DeviceCommand.id == command_id,
+                    DeviceCommand.status == "queued"
+                ).update({"status": "delivered", "delivered_at": now}, synchronize_session=False)
+                if updated:
+                    claimed.append(command_id)
+            db.commit()
+            if not claimed:
+                return []
+            entries = db.query(DeviceCommand).filter(DeviceCommand.id.in_(claimed)).order_by(DeviceCommand.id)
+            return [{
+                "id": entry.id,
+                "command": entry.command,
+                "payload": json.loads(entry.payload) if entry.payload else None,
+                "created_at": entry.created_at.isoformat(),
+            } for entry in entries]
+        finally:
+            db.close()
+
+    async def wait(self, device_id, timeout, command=None, limit=10):
+        """Claim commands for a device, waiting up to `timeout` seconds for one to be queued."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            event = asyncio.Event()
+            waiter = (loop, event)
+            # Register before checking, so a command queued in between still wakes us
+            with self._lock:
+                self._waiters.setdefault(device_id, set()).add(waiter)
+            try:
+                commands = await run_in_threadpool(self.claim, device_id, command, limit)
+                remaining = deadline - loop.time()
+                if commands or remaining <= 0:
+                    return commands
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, self.db_poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._lock:
+                    waiters = self._waiters.get(device_id)
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[device_id]
+
+    def _notify(self, device_id):
+        with self._lock:
+            waiters = list(self._waiters.get(device_id, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def pending(self, device_id):
+        db = SessionLocal()
+        try:
+            return db.query(DeviceCommand).filter(
+                DeviceCommand.device_id == device_id,
+                DeviceCommand.status == "queued"
+            ).count()
+        finally:
+            db.close()
+
+command_channel = CommandChannel()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+MANIFEST_NAME = ".manifest.json"
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _load_manifest(version_dir):
+    """Return {filename: sha256} for a published version, hashing the files if it predates manifests."""
+    if not version_dir or not os.path.isdir(version_dir):
+        return {}
+    manifest_path = os.path.join(version_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    manifest = {}
+    for name in os.listdir(version_dir):
+        path = os.path.join(version_dir, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                manifest[name] = _digest(f.read())
+    return manifest
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _publish(live_dir, version_dir):
+    """Atomically point the live_dir symlink at version_dir."""
+    target = os.path.relpath(version_dir, os.path.dirname(live_dir))
+    tmp_link = f"{live_dir}.{os.getpid()}.tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(target, tmp_link)
+    os.replace(tmp_link, live_dir)
+
+def published_names(live_dir):
+    """Names of the crops in the version currently published at live_dir."""
+    if not os.path.lexists(live_dir):
+        return set()
+    names = _load_manifest(os.path.realpath(live_dir))
+    return set(names) - {MANIFEST_NAME}
+
+def sync_crop_dir(live_dir, images, carried=None):
+    """Publish a new set of crops at live_dir, writing only what changed.
+
+    live_dir is a symlink to an immutable version directory under
+    `<live_dir>_versions`. `images` maps filenames to crop bytes; `carried`
+    maps filenames to the name of a crop in the current version whose
+    content they keep (e.g. a renumbered object). Unchanged content is
+    hard-linked from the current version, so only added or changed crops are
+    written, and readers never see a partially updated directory.
+    """
+    carried = carried or {}
+    versions_dir = f"{live_dir}_versions"
+    os.makedirs(versions_dir, exist_ok=True)
+
+    # One-time migration from a plain directory
+    if os.path.isdir(live_dir) and not os.path.islink(live_dir):
+        legacy_dir = os.path.join(versions_dir, f"v{time.time_ns()}")
+        os.rename(live_dir, legacy_dir)
+        _publish(live_dir, legacy_dir)
+
+    current_dir = os.path.realpath(live_dir) if os.path.islink(live_dir) else None
+    current = _load_manifest(current_dir)
+    by_digest = {digest: name for name, digest in current.items()}
+
+    manifest = {name: _digest(data) for name, data in images.items()}
+    for name, old_name in carried.items():
+        if name not in manifest and old_name in current:
+            manifest[name] = current[old_name]
+
+    stats = {"written": 0, "linked": 0, "removed": len(set(current) - set(manifest)), "bytes_written": 0}
+    if manifest == current:
+        stats["linked"] = len(manifest)
+        return stats
+
+    version_dir = os.path.join(versions_dir, f"v{time.time_ns()}")
+    os.makedirs(version_dir)
+    for name, digest in manifest.items():
+        dst = os.path.join(version_dir, name)
+        if digest in by_digest:
+            _link_or_copy(os.path.join(current_dir, by_digest[digest]), dst)
+            stats["linked"] += 1
+        else:
+            with open(dst, 'wb') as f:
+                f.write(images[name])
+            stats["written"] += 1
+            stats["bytes_written"] += len(images[name])
+    with open(os.path.join(version_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+    _publish(live_dir, version_dir)
+
+    # Keep the previous version for readers still holding paths into it
+    keep = {os.path.basename(version_dir), os.path.basename(current_dir or "")}
+    for name in os.listdir(versions_dir):
+        if name not in keep:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+    return stats
@@ -0,0 +1,161 @@
+import collections
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+
+FORWARD_WORKERS = int(os.getenv('FORWARD_WORKERS', '1'))
+FORWARD_MAX_ATTEMPTS = int(os.getenv('FORWARD_MAX_ATTEMPTS', '4'))
+FORWARD_BACKOFF = float(os.getenv('FORWARD_BACKOFF', '1.0'))
+FORWARD_CONNECT_TIMEOUT = float(os.getenv('FORWARD_CONNECT_TIMEOUT', '5'))
+FORWARD_READ_TIMEOUT = float(os.getenv('FORWARD_READ_TIMEOUT', '60'))
+
+class Forwarder:
+    """Background queue that uploads photos to the processing API over a pooled keep-alive session.
+
+    `submit` returns an upload id immediately. Workers send uploads in
+    submission order (one worker keeps photos in order), retrying failures
+    with jittered exponential backoff; an upload still failing after
+    `max_attempts` goes to the dead-letter list, from which it can be
+    retried. The processing API must acknowledge the full file size for an
+    upload to count as delivered.
+    """
+
+    def __init__(self, url, workers=FORWARD_WORKERS, max_attempts=FORWARD_MAX_ATTEMPTS, backoff=FORWARD_BACKOFF,
+                 timeout=(FORWARD_CONNECT_TIMEOUT, FORWARD_READ_TIMEOUT), history=500):
+        self.url = url
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._queue = queue.Queue()
+        self._uploads = collections.OrderedDict()
+        self._history = history
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self.counts = {"delivered": 0, "retried": 0, "dead": 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True, name=f"forwarder-{i}")
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, image_path, on_done=None):
+        """Queue a photo for upload and return its id.
+
+        on_done(upload) runs when it is delivered, and each time it goes dead.
+        """
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {
+                "id": upload_id,
+                "path": image_path,
+                "status": "queued",
+                "attempts": 0,
+                "error": None,
+                "queued_at": time.time(),
+                "delivered_at": None,
+            }
+            if on_done:
+                self._callbacks[upload_id] = on_done
+            self._trim()
+        self._queue.put(upload_id)
+        return upload_id
+
+    def retry(self, upload_id):
+        """Requeue a dead upload. Returns False if it is not in the dead-letter list."""
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None or upload["status"] != "dead":
+                return False
+            upload.update(status="queued", attempts=0, error=None)
+        self._queue.put(upload_id)
+        return True
+
+    def get(self, upload_id):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            return dict(upload) if upload else None
+
+    def dead_letters(self):
+        with self._lock:
+            return [dict(u) for u in self._uploads.values() if u["status"] == "dead"]
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queue.qsize(), **self.counts}
+
+    def _trim(self):
+        # Forget the oldest finished uploads; dead ones are kept until retried
+        while len(self._uploads) > self._history:
+            for upload_id, upload in self._uploads.items():
+                if upload["status"] == "delivered":
+                    del self._uploads[upload_id]
+                    break
+            else:
+                return
+
+    def _set(self, upload_id, **fields):
+        with self._lock:
+            self._uploads[upload_id].update(fields)
+            return dict(self._uploads[upload_id])
+
+    def _send(self, path):
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            response = self.session.post(self.url, files={'file': (os.path.basename(path), f)}, timeout=self.timeout)
+        response.raise_for_status()
+        # The processing API echoes the stored sizes; a short one means the upload was cut off
+        received = [entry.get('size') for entry in response.json().get('files', [])]
+        if received and size not in received:
+            raise IOError(f"processing API stored {received} bytes of {size}")
+        return response
+
+    def _run(self):
+        while True:
+            upload_id = self._queue.get()
+            upload = self._set(upload_id, status="sending")
+            while True:
+                attempts = upload["attempts"] + 1
+                try:
+                    self._send(upload["path"])
+                    upload = self._set(upload_id, status="delivered", attempts=attempts, delivered_at=time.time())
+                    with self._lock:
+                        self.counts["delivered"] += 1
+                    print(f"[forward] {os.path.basename(upload['path'])} delivered after {attempts} attempt(s)")
+                    break
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    if attempts >= self.max_attempts or not os.path.exists(upload["path"]):
+                        upload = self._set(upload_id, status="dead", attempts=attempts, error=error)
+                        with self._lock:
+                            self.counts["dead"] += 1
+                        print(f"[forward] {os.path.basename(upload['path'])} dead after {attempts} attempt(s): {error}")
+                        break
+                    upload = self._set(upload_id, status="retrying", attempts=attempts, error=error)
+                    with self._lock:
+                        self.counts["retried"] += 1
+                    delay = self.backoff * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+                    print(f"[forward] attempt {attempts} failed ({error}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+            with self._lock:
+                # Kept for dead uploads, so it still runs if a retry delivers them
+                if upload["status"] == "delivered":
+                    callback = self._callbacks.pop(upload_id, None)
+                else:
+                    callback = self._callbacks.get(upload_id)
+            if callback:
+                try:
+                    callback(upload)
+                except Exception as e:
+                    print(f"[forward] on_done for {upload_id} failed: {e}")
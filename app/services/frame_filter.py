@@ -0,0 +1,67 @@
+import os
+import threading
+import numpy as np
+from PIL import Image
+
+# Frames are compared on a downscaled RGB grid, normalized for overall brightness.
+# A cell has changed when a channel differs by more than FRAME_CELL_TOLERANCE, and
+# a frame is forwarded when more than FRAME_DIFF_THRESHOLD of its cells have changed.
+FRAME_GRID = (32, 24)
+FRAME_CELL_TOLERANCE = float(os.getenv('FRAME_CELL_TOLERANCE', '20'))
+FRAME_DIFF_THRESHOLD = float(os.getenv('FRAME_DIFF_THRESHOLD', '0.005'))
+
+def frame_signature(image_path, grid=FRAME_GRID):
+    """Mean color of each cell of a grid laid over the frame."""
+    with Image.open(image_path) as img:
+        small = img.convert('RGB').resize(grid, Image.BOX)
+    return np.asarray(small, dtype=np.float32)
+
+def frame_difference(a, b, tolerance=FRAME_CELL_TOLERANCE):
+    """Fraction of grid cells that changed between two signatures."""
+    b = b * (a.mean() / max(b.mean(), 1.0))
+    return float((np.abs(a - b).max(axis=2) > tolerance).mean())
+
+class FrameFilter:
+    """Drops frames that look the same as the last frame forwarded for the same fridge."""
+
+    def __init__(self, threshold=FRAME_DIFF_THRESHOLD, tolerance=FRAME_CELL_TOLERANCE):
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self._last = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def check(self, fridge_id, image_path, force=False):
+        """Return (forward, difference) and keep the frame as the fridge's reference if forwarded.
+
+        difference is None for the first frame of a fridge.
+        """
+        signature = frame_signature(image_path)
+        with self._lock:
+            last = self._last.get(fridge_id)
+            difference = frame_difference(last, signature, self.tolerance) if last is not None else None
+            forward = force or difference is None or difference > self.threshold
+            counts = self._counts.setdefault(fridge_id, {"forwarded": 0, "skipped": 0})
+            counts["forwarded" if forward else "skipped"] += 1
+            if forward:
+                self._last[fridge_id] = signature
+        return forward, difference
+
+    def forget(self, fridge_id):
+        """Drop the fridge's reference frame, e.g. when forwarding the last frame failed."""
+        with self._lock:
+            self._last.pop(fridge_id, None)
+
+    def restore(self, fridge_id, image_path):
+        """Make a late-delivered frame the reference, unless a newer frame has already become it."""
+        signature = frame_signature(image_path)
+        with self._lock:
+            self._last.setdefault(fridge_id, signature)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "tolerance": self.tolerance,
+                "fridges": {fridge_id: dict(counts) for fridge_id, counts in self._counts.items()},
+            }
@@ -1,3 +1,4 @@
+from sqlalchemy import case, delete, update
 from sqlalchemy.orm import Session
 from ..models.database import FoodItem
 from datetime import datetime, timedelta
@@ -72,6 +73,41 @@ def update_fridge_from_gemini(food_list, db: Session):
             food_item.status = status
     db.commit()
 
+def reconcile_detection_diff(db: Session, match_json, delete_json, add_json):
+    """Apply a detection diff with set-based statements; the caller commits once.
+
+    Deleted objects go in one DELETE, matched objects are renumbered in one
+    UPDATE whose CASE reads the original ids (so swaps like 1->2, 2->1 are
+    safe), and new objects are inserted in bulk.
+    """
+    delete_ids = [entry['old_object_id'] for entry in delete_json]
+    if delete_ids:
+        db.execute(
+            delete(FoodItem)
+            .where(FoodItem.temp_object_id.in_(delete_ids))
+            .execution_options(synchronize_session=False)
+        )
+
+    remap = {entry['old_object_id']: entry['new_object_id'] for entry in match_json}
+    if remap:
+        db.execute(
+            update(FoodItem)
+            .where(FoodItem.temp_object_id.in_(list(remap)))
+            .values(temp_object_id=case(remap, value=FoodItem.temp_object_id))
+            .execution_options(synchronize_session=False)
+        )
+
+    if add_json:
+        db.bulk_insert_mappings(FoodItem, [
+            {
+                "temp_object_id": entry['new_object_id'],
+                "name": f"Object {entry['new_object_id']}",
+                "category": "unknown",
+                "status": "fresh"
+            }
+            for entry in add_json
+        ])
+
 def check_spoilage(db: Session):
     """Check for items that might be spoiling soon"""
     foods = db.query(FoodItem).filter(FoodItem.status == "spoiling").all()
@@ -0,0 +1,299 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import and_, exists, or_, update
+from sqlalchemy.orm import aliased
+from ..database import SessionLocal
+from ..models.database import Job
+
+class JobQueue:
+    """Durable job queue stored in the jobs table, drained by a pool of worker threads.
+
+    Each job kind is a list of named stages. A stage gets the job payload and
+    the DB session that marks it complete, so database work done by a stage is
+    committed together with the stage record. It may return a new payload,
+    which is persisted for the following stages. A failed stage is retried
+    with backoff, resuming from that stage, up to `max_attempts`.
+
+    Jobs of the same fridge run one at a time in submission order; jobs of
+    different fridges run in parallel. A failed job holds back the later jobs
+    of its fridge until it is retried or discarded, since each diff builds on
+    the one before it. Claims are single UPDATE statements, so
+    this also holds across several server processes sharing the database.
+    While a job runs, its updated_at is refreshed every quarter lease, so a
+    slow stage is not mistaken for an abandoned job.
+    """
+
+    def __init__(self, workers=2, poll_interval=1.0, max_attempts=3, retry_backoff=5.0, lease_seconds=600):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease = timedelta(seconds=lease_seconds)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._active = set()
+        self._active_lock = threading.Lock()
+
+    def register(self, kind, stages):
+        """Register the (name, function) stages run for jobs of this kind."""
+        self.handlers[kind] = stages
+
+    def submit(self, kind, payload, fridge_id="default"):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        db = SessionLocal()
+        try:
+            job = Job(fridge_id=fridge_id, kind=kind, payload=json.dumps(payload), status="queued")
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        finally:
+            db.close()
+        self._wakeup.set()
+        return job_id
+
+    def retry(self, job_id):
+        """Requeue a failed job from the stage that failed.
+
+        Returns False if it is not failed, or if a newer job of its fridge has
+        already finished (replaying it then would apply the diffs out of order).
+        """
+        other = aliased(Job)
+        db = SessionLocal()
+        try:
+            newer_done = exists().where(other.fridge_id == Job.fridge_id, other.id > Job.id, other.status == "done")
+            updated = db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "failed", ~newer_done)
+                .values(status="queued", attempts=0, error=None, run_after=None, updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        self._wakeup.set()
+        return bool(updated)
+
+    def discard(self, job_id):
+        """Give up on a failed job, so the later jobs of its fridge can run. Returns False if it is not failed."""
+        db = SessionLocal()
+        try:
+            updated = db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "failed")
+                .values(status="discarded", updated_at=datetime.utcnow())
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        self._wakeup.set()
+        return bool(updated)
+
+    def get(self, job_id):
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            return self._describe(job) if job else None
+        finally:
+            db.close()
+
+    def list(self, fridge_id=None, status=None, limit=50):
+        db = SessionLocal()
+        try:
+            query = db.query(Job)
+            if fridge_id:
+                query = query.filter(Job.fridge_id == fridge_id)
+            if status:
+                query = query.filter(Job.status == status)
+            return [self._describe(job) for job in query.order_by(Job.id.desc()).limit(limit)]
+        finally:
+            db.close()
+
+    def _describe(self, job):
+        return {
+            "id": job.id,
+            "fridge_id": job.fridge_id,
+            "kind": job.kind,
+            "status": job.status,
+            "stage": job.stage,
+            "stages": [name for name, _ in self.handlers.get(job.kind, [])],
+            "progress": job.progress,
+            "attempts": job.attempts,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        }
+
+    def start(self):
+        self._recover()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True, name=f"job-worker-{i}")
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, daemon=True, name="job-heartbeat")
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _recover(self):
+        """Requeue jobs left running by a dead worker: one of ours from before a restart, or an expired lease."""
+        db = SessionLocal()
+        try:
+            stale_before = datetime.utcnow() - self.lease
+            host = socket.gethostname()
+            with self._active_lock:
+                active = set(self._active)
+            for job in db.query(Job).filter(Job.status == "running").all():
+                # Our own jobs are alive: their worker threads keep updated_at fresh
+                if job.worker == self.worker_id or job.id in active:
+                    continue
+                worker_host, _, pid = (job.worker or "").rpartition(":")
+                dead_here = worker_host == host and pid.isdigit() and not _pid_alive(int(pid))
+                if dead_here or job.updated_at < stale_before:
+                    print(f"[jobs] Requeueing job {job.id} abandoned by {job.worker}")
+                    job.status = "queued"
+                    job.worker = None
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        other = aliased(Job)
+        db = SessionLocal()
+        try:
+            # Blocked if the fridge has a running job, or an older queued or failed one
+            def blocked(fridge_id, job_id):
+                return exists().where(
+                    other.fridge_id == fridge_id,
+                    or_(other.status == "running", and_(other.status.in_(("queued", "failed")), other.id < job_id))
+                )
+
+            candidate = db.query(Job).filter(
+                Job.status == "queued",
+                or_(Job.run_after.is_(None), Job.run_after <= now),
+                ~blocked(Job.fridge_id, Job.id)
+            ).order_by(Job.id).first()
+            if candidate is None:
+                return None
+            claimed = db.execute(
+                update(Job)
+                .where(Job.id == candidate.id, Job.status == "queued", ~blocked(candidate.fridge_id, candidate.id))
+                .values(status="running", worker=self.worker_id, attempts=Job.attempts + 1, updated_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            return candidate.id if claimed else None
+        finally:
+            db.close()
+
+    def _run(self):
+        last_recover = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                job_id = self._claim()
+            except Exception as e:
+                print(f"[jobs] Claim failed: {e}")
+                job_id = None
+            if job_id is None:
+                if time.monotonic() - last_recover > self.lease.total_seconds():
+                    self._recover()
+                    last_recover = time.monotonic()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            with self._active_lock:
+                self._active.add(job_id)
+            try:
+                self._execute(job_id)
+            finally:
+                with self._active_lock:
+                    self._active.discard(job_id)
+            # Finishing a job may unblock the next one for the same fridge
+            self._wakeup.set()
+
+    def _heartbeat(self):
+        """Refresh updated_at of the jobs this process is running, so their lease does not expire."""
+        interval = self.lease.total_seconds() / 4
+        while not self._stop.wait(interval):
+            with self._active_lock:
+                active = list(self._active)
+            if not active:
+                continue
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(Job)
+                    .where(Job.id.in_(active), Job.status == "running", Job.worker == self.worker_id)
+                    .values(updated_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+            except Exception as e:
+                print(f"[jobs] Heartbeat failed: {e}")
+            finally:
+                db.close()
+
+    def _execute(self, job_id):
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            stages = self.handlers[job.kind]
+            names = [name for name, _ in stages]
+            start = names.index(job.stage) + 1 if job.stage in names else 0
+            payload = json.loads(job.payload)
+            for index in range(start, len(stages)):
+                name, func = stages[index]
+                print(f"[jobs] Job {job_id} ({job.kind}, fridge {job.fridge_id}): {name}")
+                result = func(payload, db)
+                if result is not None:
+                    payload = result
+                    job.payload = json.dumps(payload)
+                job.stage = name
+                job.progress = (index + 1) / len(stages)
+                job.updated_at = datetime.utcnow()
+                db.commit()
+            job.status = "done"
+            job.worker = None
+            job.updated_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            self._fail(db, job_id, e)
+        finally:
+            db.close()
+
+    def _fail(self, db, job_id, error):
+        job = db.query(Job).filter(Job.id == job_id).first()
+        job.error = f"{type(error).__name__}: {error}"
+        job.worker = None
+        job.updated_at = datetime.utcnow()
+        if job.attempts < self.max_attempts:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=self.retry_backoff * 2 ** (job.attempts - 1))
+            print(f"[jobs] Job {job_id} failed at attempt {job.attempts}, retrying after {job.run_after}")
+        else:
+            job.status = "failed"
+            print(f"[jobs] Job {job_id} failed after {job.attempts} attempts: {job.error}")
+        db.commit()
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,323 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from PIL import Image
+from ..database import SessionLocal
+from ..models.database import FoodItem
+from .cache_service import PersistentCache
+
+load_dotenv()
+
+LABEL_MODEL = os.getenv('LABEL_MODEL', 'gpt-4o-mini')
+# Maximum number of vision requests in flight at once
+LABEL_CONCURRENCY = int(os.getenv('LABEL_CONCURRENCY', '8'))
+# Seconds before a single vision request is abandoned and retried
+LABEL_TIMEOUT = float(os.getenv('LABEL_TIMEOUT', '30'))
+LABEL_RETRIES = int(os.getenv('LABEL_RETRIES', '2'))
+# Base delay of the exponential backoff between retries, in seconds
+LABEL_BACKOFF = float(os.getenv('LABEL_BACKOFF', '1.0'))
+
+# "inline" sends crops as base64 data URLs, "url" makes the model fetch them through VITE_NGROK_URL_BASE
+LABEL_IMAGE_MODE = os.getenv('LABEL_IMAGE_MODE', 'inline')
+# Inline crops are downscaled to this longest edge and re-encoded (jpeg/webp/png)
+LABEL_IMAGE_MAX_EDGE = int(os.getenv('LABEL_IMAGE_MAX_EDGE', '512'))
+LABEL_IMAGE_FORMAT = os.getenv('LABEL_IMAGE_FORMAT', 'jpeg')
+LABEL_IMAGE_QUALITY = int(os.getenv('LABEL_IMAGE_QUALITY', '85'))
+
+# Crops per vision request in batched mode; 1 sends one request per crop
+LABEL_BATCH_SIZE = int(os.getenv('LABEL_BATCH_SIZE', '10'))
+
+# Label cache entries are keyed by the sha256 of the crop bytes
+LABEL_CACHE_TTL = int(os.getenv('LABEL_CACHE_TTL', str(24 * 3600)))
+LABEL_CACHE_SIZE = int(os.getenv('LABEL_CACHE_SIZE', '2000'))
+
+LABEL_PROMPT = "Analyze the image and list all visible food items, their estimated category, expiry date (if possible), and whether they look fresh, spoiling, or spoiled. Return your answer as a JSON object with keys: name, category, expiry_date, status. If you don't know expiry_date, return null."
+
+BATCH_LABEL_PROMPT = "Each image below is a single item from a fridge, preceded by its temp_object_id. For every image, identify the food item, its estimated category, expiry date (if possible, as YYYY-MM-DD, otherwise null), and whether it looks fresh, spoiling, or spoiled. Return one entry per temp_object_id."
+
+BATCH_LABEL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "temp_object_id": {"type": "integer"},
+                    "name": {"type": "string"},
+                    "category": {"type": "string"},
+                    "expiry_date": {"type": ["string", "null"]},
+                    "status": {"type": "string", "enum": ["fresh", "spoiling", "spoiled"]}
+                },
+                "required": ["temp_object_id", "name", "category", "expiry_date", "status"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["items"],
+    "additionalProperties": False
+}
+
+# Bumped automatically whenever a prompt or the batch schema changes, so old labels are not reused.
+# Both prompts are hashed because batched labeling falls back to per-crop requests.
+PROMPT_VERSION = hashlib.sha1(json.dumps(
+    [LABEL_PROMPT, BATCH_LABEL_PROMPT, BATCH_LABEL_SCHEMA], sort_keys=True
+).encode()).hexdigest()[:8]
+
+label_cache = PersistentCache("labels", ttl_seconds=LABEL_CACHE_TTL, max_entries=LABEL_CACHE_SIZE)
+
+_client = None
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_client():
+    """Shared AsyncOpenAI client, created on first use."""
+    global _client
+    if _client is None:
+        # Retries are handled here so they respect LABEL_TIMEOUT and the concurrency limit
+        _client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return _client
+
+def _get_loop():
+    # The client's connection pool is bound to one event loop, so all labeling
+    # runs on a single long-lived loop in a background thread.
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True, name="labeling-loop").start()
+    return _loop
+
+def run_labeling(coro):
+    """Run a labeling coroutine on the shared loop from synchronous code and wait for it."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+def crop_image_url(image_path):
+    ngrok_base = os.getenv('VITE_NGROK_URL_BASE')
+    return f"{ngrok_base}/static/ind_images/{os.path.basename(image_path)}"
+
+def inline_image_url(image_path, max_edge=LABEL_IMAGE_MAX_EDGE, fmt=LABEL_IMAGE_FORMAT, quality=LABEL_IMAGE_QUALITY):
+    """Downscale and re-encode a crop into a base64 data URL."""
+    with Image.open(image_path) as img:
+        img = img.convert('RGB')
+        img.thumbnail((max_edge, max_edge))
+        buffer = io.BytesIO()
+        if fmt == 'png':
+            img.save(buffer, format='PNG', optimize=True)
+        else:
+            img.save(buffer, format=fmt.upper(), quality=quality)
+    return f"data:image/{fmt};base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+async def crop_image_input(image_path, mode=LABEL_IMAGE_MODE):
+    if mode == 'url':
+        return crop_image_url(image_path)
+    # Decoding and re-encoding is CPU work, keep it off the event loop
+    return await asyncio.to_thread(inline_image_url, image_path)
+
+def parse_label(content):
+    start = content.find('{')
+    end = content.rfind('}') + 1
+    return json.loads(content[start:end])
+
+async def _request_with_retries(what, make_request, semaphore):
+    """Await make_request() under the semaphore with a timeout, retrying with jittered exponential backoff."""
+    for attempt in range(LABEL_RETRIES + 1):
+        try:
+            async with semaphore:
+                return await asyncio.wait_for(make_request(), timeout=LABEL_TIMEOUT)
+        except Exception as e:
+            if attempt == LABEL_RETRIES:
+                print(f"[ERROR] Labeling {what} failed after {attempt + 1} attempts: {e!r}")
+                return None
+            delay = LABEL_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+            print(f"[WARN] Labeling {what} failed ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def analyze_crop(client, image_path, semaphore, model=LABEL_MODEL):
+    """Label one crop. Returns None on failure."""
+    what = os.path.basename(image_path)
+    try:
+        image_url = await crop_image_input(image_path)
+    except Exception as e:
+        print(f"[ERROR] Could not encode {what}: {e!r}")
+        return None
+
+    async def make_request():
+        response = await client.responses.create(
+            model=model,
+            input=[
+                {"role": "user", "content": LABEL_PROMPT},
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "input_image",
+                            "image_url": image_url
+                        }
+                    ]
+                }
+            ]
+        )
+        return parse_label(response.output_text)
+
+    return await _request_with_retries(what, make_request, semaphore)
+
+async def analyze_crop_batch(client, crops, semaphore, model=LABEL_MODEL):
+    """Label several crops in one structured-output request.
+
+    Returns {temp_object_id: label} for the ids the model answered; ids that
+    are missing (or a failed request) are left for the caller to retry per crop.
+    """
+    content = [{"type": "input_text", "text": BATCH_LABEL_PROMPT}]
+    for temp_object_id, image_path in crops.items():
+        try:
+            image_url = await crop_image_input(image_path)
+        except Exception as e:
+            print(f"[ERROR] Could not encode {os.path.basename(image_path)}: {e!r}")
+            continue
+        content.append({"type": "input_text", "text": f"temp_object_id: {temp_object_id}"})
+        content.append({"type": "input_image", "image_url": image_url})
+    if len(content) == 1:
+        return {}
+
+    async def make_request():
+        response = await client.responses.create(
+            model=model,
+            input=[{"role": "user", "content": content}],
+            text={
+                "format": {
+                    "type": "json_schema",
+                    "name": "crop_labels",
+                    "schema": BATCH_LABEL_SCHEMA,
+                    "strict": True
+                }
+            }
+        )
+        return json.loads(response.output_text)['items']
+
+    items = await _request_with_retries(f"batch of {len(crops)}", make_request, semaphore) or []
+    labels = {}
+    for item in items:
+        temp_object_id = item.pop('temp_object_id', None)
+        if temp_object_id in crops:
+            labels[temp_object_id] = item
+    return labels
+
+async def label_crops(crops, client=None, concurrency=LABEL_CONCURRENCY, model=LABEL_MODEL, batch_size=LABEL_BATCH_SIZE):
+    """Label {temp_object_id: image_path} concurrently, returning {temp_object_id: label or None}.
+
+    With batch_size > 1 crops are sent batch_size at a time in one request
+    each, and any id missing from a batch answer falls back to a per-crop call.
+    """
+    client = client or get_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    ids = list(crops)
+    labels = {}
+    if batch_size > 1:
+        chunks = [{i: crops[i] for i in ids[start:start + batch_size]} for start in range(0, len(ids), batch_size)]
+        for chunk_labels in await asyncio.gather(*(analyze_crop_batch(client, chunk, semaphore, model) for chunk in chunks)):
+            labels.update(chunk_labels)
+        if len(labels) < len(ids):
+            print(f"[labeling] {len(ids) - len(labels)} crops missing from batch answers, labeling them one by one")
+
+    missing = [i for i in ids if i not in labels]
+    results = await asyncio.gather(*(analyze_crop(client, crops[i], semaphore, model) for i in missing))
+    labels.update(zip(missing, results))
+    return labels
+
+def analyze_image_with_openai(image_path):
+    """Label a single crop synchronously."""
+    return run_labeling(_analyze_single(image_path))
+
+async def _analyze_single(image_path):
+    return await analyze_crop(get_client(), image_path, asyncio.Semaphore(1))
+
+def crop_hash(image_path):
+    """sha256 of a crop file. Exact, so crops that only share a shape never share a label."""
+    with open(image_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def label_cache_key(image_path, model=LABEL_MODEL):
+    return f"{model}:{PROMPT_VERSION}:sha256:{crop_hash(image_path)}"
+
+async def label_crops_cached(crops, client=None, concurrency=LABEL_CONCURRENCY, model=LABEL_MODEL):
+    """Like label_crops, but crops whose hash is in the label cache are not sent to the model."""
+    keys = {}
+    for temp_object_id, image_path in crops.items():
+        try:
+            keys[temp_object_id] = label_cache_key(image_path, model)
+        except Exception as e:
+            print(f"[WARN] Could not hash {os.path.basename(image_path)}: {e}")
+    cached = label_cache.get_many(keys.values())
+    labels = {i: cached[keys[i]] for i in crops if keys.get(i) in cached}
+
+    missing = {i: path for i, path in crops.items() if i not in labels}
+    if missing:
+        fresh = await label_crops(missing, client=client, concurrency=concurrency, model=model)
+        labels.update(fresh)
+        label_cache.set_many({keys[i]: label for i, label in fresh.items() if label and i in keys})
+    print(f"[labeling] {len(crops) - len(missing)} cached, {len(missing)} sent to {model}")
+    return labels
+
+def list_crops(images_dir, extensions):
+    """Map temp_object_id -> crop path for every object_<id>.<ext> file in images_dir."""
+    crops = {}
+    for filename in os.listdir(images_dir):
+        if filename.endswith(extensions):
+            try:
+                temp_object_id = int(filename.split('_')[1].split('.')[0])  # e.g., object_3.png → 3
+            except Exception as e:
+                print(f"[ERROR] Could not parse temp_object_id from {filename}: {e}")
+                continue
+            crops[temp_object_id] = os.path.join(images_dir, filename)
+    return crops
+
+def apply_labels(db, labels):
+    """Write {temp_object_id: label} onto the matching FoodItems; the caller commits."""
+    ids = [i for i, info in labels.items() if info]
+    if not ids:
+        return 0
+    items = db.query(FoodItem).filter(FoodItem.temp_object_id.in_(ids)).all()
+    for item in items:
+        food_info = labels[item.temp_object_id]
+        item.name = food_info.get('name', item.name)
+        item.category = food_info.get('category', item.category)
+        item.status = food_info.get('status', item.status)
+        expiry = food_info.get('expiry_date')
+        if expiry:
+            try:
+                item.expiry_date = datetime.fromisoformat(expiry)
+            except Exception:
+                item.expiry_date = None
+    return len(items)
+
+def update_food_items_from_images(images_dir, extensions=('.png',), temp_object_ids=None):
+    """Label the crops in images_dir concurrently and apply all results in one transaction.
+
+    With temp_object_ids, only the crops of those objects are labeled.
+    """
+    crops = list_crops(images_dir, extensions)
+    if temp_object_ids is not None:
+        wanted = set(temp_object_ids)
+        crops = {i: path for i, path in crops.items() if i in wanted}
+    if not crops:
+        return
+    start = time.perf_counter()
+    labels = run_labeling(label_crops_cached(crops))
+    print(f"[labeling] {len(crops)} crops labeled in {time.perf_counter() - start:.2f}s")
+
+    db = SessionLocal()
+    try:
+        apply_labels(db, labels)
+        db.commit()
+    finally:
+        db.close()
@@ -1,15 +1,86 @@
 import aiohttp
+import hashlib
+import json
 import os
+import re
+import threading
 from dotenv import load_dotenv
 from ..schemas.schemas import RecipeSuggestion
 from ..database import get_db
 from sqlalchemy.orm import Session
 from ..models.database import FoodItem
 from openai import OpenAI
+from .cache_service import PersistentCache
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+RECIPE_MODEL = os.getenv('RECIPE_MODEL', 'gpt-3.5-turbo')
+# Recipes for the same ingredient set are reused until they are RECIPE_CACHE_TTL seconds old
+RECIPE_CACHE_TTL = int(os.getenv('RECIPE_CACHE_TTL', str(24 * 3600)))
+RECIPE_CACHE_SIZE = int(os.getenv('RECIPE_CACHE_SIZE', '500'))
+
+RECIPE_PROMPT = """Based on the following selected ingredients, suggest a recipe I can make. 
+Please prioritize using the items marked with ⚠️ (spoiled or spoiling) first:
+
+{ingredients_text}
+
+Please provide:
+1. Recipe name
+2. List of ingredients needed (including what I have and what I need to buy)
+3. Step-by-step instructions
+4. Estimated cooking time
+5. Difficulty level
+
+Format the response in a clear, easy-to-read way. Make sure to use the items that are about to spoil first!"""
+
+recipe_cache = PersistentCache("recipes", ttl_seconds=RECIPE_CACHE_TTL, max_entries=RECIPE_CACHE_SIZE)
+
+_client = None
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+
+def get_client():
+    """Shared OpenAI client, created on first use."""
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return _client
+
+def normalize_ingredient(name):
+    return re.sub(r"\s+", " ", name).strip().lower()
+
+def recipe_cache_key(kind, model, prompt, ingredients):
+    """Cache key for a recipe from (name, status) pairs; order, case and duplicates do not matter."""
+    items = sorted({(normalize_ingredient(name), (status or "").lower()) for name, status in ingredients})
+    # The prompt is part of the key, so editing it does not serve recipes made from the old one
+    prompt_version = hashlib.sha1(prompt.encode()).hexdigest()[:8]
+    digest = hashlib.sha1(json.dumps(items, ensure_ascii=False).encode()).hexdigest()
+    return f"{kind}:{model}:{prompt_version}:{digest}"
+
+def cached_recipe(key, generate):
+    """Return the cached recipe for key, or generate and cache it.
+
+    Concurrent requests for the same key wait for a single model call.
+    """
+    recipe = recipe_cache.get(key)
+    if recipe is not None:
+        return recipe
+    with _key_locks_lock:
+        lock = _key_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            # Another request may have filled the entry while this one waited
+            recipe = recipe_cache.get(key, count=False)
+            if recipe is None:
+                recipe = generate()
+                recipe_cache.set(key, recipe)
+            return recipe
+    finally:
+        with _key_locks_lock:
+            if _key_locks.get(key) is lock and not lock.locked():
+                del _key_locks[key]
+
 def get_recipe_suggestion(db: Session, selected_foods=None) -> str:
     """Get a recipe suggestion based on selected ingredients in the fridge"""
     if not selected_foods:
@@ -31,29 +102,18 @@ def get_recipe_suggestion(db: Session, selected_foods=None) -> str:
             ingredients.append(food.name)
     
     ingredients_text = "\n".join(ingredients)
-    
-    # Initialize OpenAI client
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    
-    try:
-        response = client.responses.create(
-            model="gpt-3.5-turbo",
-            input=[
-                {"role": "user", "content": f"""Based on the following selected ingredients, suggest a recipe I can make. 
-Please prioritize using the items marked with ⚠️ (spoiled or spoiling) first:
-
-{ingredients_text}
 
-Please provide:
-1. Recipe name
-2. List of ingredients needed (including what I have and what I need to buy)
-3. Step-by-step instructions
-4. Estimated cooking time
-5. Difficulty level
-
-Format the response in a clear, easy-to-read way. Make sure to use the items that are about to spoil first!"""}
-            ]
+    def generate():
+        response = get_client().responses.create(
+            model=RECIPE_MODEL,
+            input=[{"role": "user", "content": RECIPE_PROMPT.format(ingredients_text=ingredients_text)}]
         )
         return response.output_text
+
+    # Spoiled and spoiling items are flagged in the prompt, so their status is part of the key
+    flags = [(food.name, food.status if food.status.lower() in ("spoiled", "spoiling") else None)
+             for food in selected_foods]
+    try:
+        return cached_recipe(recipe_cache_key("suggestion", RECIPE_MODEL, RECIPE_PROMPT, flags), generate)
     except Exception as e:
         return f"Sorry, I couldn't generate a recipe suggestion at the moment. Error: {str(e)}" 
\ No newline at end of file
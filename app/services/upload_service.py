@@ -0,0 +1,127 @@
+import hashlib
+import os
+import uuid
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv('MAX_IMAGE_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+MAX_ZIP_UPLOAD_BYTES = int(os.getenv('MAX_ZIP_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+class UploadLimitMiddleware:
+    """ASGI middleware capping the request body size per path.
+
+    A Content-Length over the limit is refused with 413 before the body is
+    read. Bodies sent without one are counted as they arrive and cut off
+    with 413 once they cross the limit, before the form parser spools the
+    rest to disk.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            await self._reject(scope, receive, send, limit)
+            return
+        received = 0
+        started = False
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the endpoint's body parsing, so FastAPI answers with it
+                    raise HTTPException(status_code=413, detail=str(UploadTooLarge(limit)))
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, tracking_send)
+        except HTTPException as e:
+            if started or e.status_code != 413:
+                raise
+            await self._reject(scope, receive, send, limit)
+
+    @staticmethod
+    async def _reject(scope, receive, send, limit):
+        response = JSONResponse(status_code=413, content={"detail": str(UploadTooLarge(limit))})
+        await response(scope, receive, send)
+
+class _HashingWriter:
+    """Writes chunks to a temporary file next to `path`, counting and optionally hashing as it goes."""
+
+    def __init__(self, path, max_bytes, digest=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        self.size = 0
+        self.sha256 = hashlib.sha256() if digest else None
+        self.file = open(self.tmp_path, 'wb')
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        if self.sha256:
+            self.sha256.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        return self.size, self.sha256.hexdigest() if self.sha256 else None
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def save_chunks(chunks, path, max_bytes=None, digest=True):
+    """Stream an iterable of byte chunks to path. Returns (size, sha256 hex digest).
+
+    The file only appears at path once complete; UploadTooLarge is raised as
+    soon as the limit is crossed. With digest=False the hash is skipped and
+    returned as None.
+    """
+    writer = _HashingWriter(path, max_bytes, digest)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+        return writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+async def save_upload(upload, path, max_bytes=None, digest=True, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Async save_chunks for an UploadFile, with file I/O kept off the event loop."""
+    writer = await run_in_threadpool(_HashingWriter, path, max_bytes, digest)
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            await run_in_threadpool(writer.write, chunk)
+        return await run_in_threadpool(writer.commit)
+    except BaseException:
+        await run_in_threadpool(writer.abort)
+        raise
@@ -0,0 +1,95 @@
+"""Raspberry Pi photo capture: the original read-and-discard sequence versus FrameGrabber.
+
+Runs against FakeCamera, so no hardware is needed. The flash is simulated
+with the same timing as hubear.flash_led. For each shot it reports the time
+from trigger to frame, how old the frame was when returned, and whether it
+was exposed after the LEDs went off for the last time.
+
+    python -m benchmarks.capture --shots 10 --fps 30
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from frame_grabber import FakeCamera, FrameGrabber, SETTLE_FRAMES
+
+
+def simulated_flash(times, delay, lights_off=None):
+    """hubear.flash_led without the LEDs: on/off `times` times, setting lights_off after the last off."""
+    for _ in range(times):
+        time.sleep(delay)
+        if lights_off and _ == times - 1:
+            lights_off.set()
+        time.sleep(delay)
+
+
+def legacy_take(camera, flash):
+    """The original take_photo: flash, then read and discard five frames with 50 ms sleeps."""
+    flash()
+    for _ in range(5):
+        camera.read()
+        time.sleep(0.05)
+    _, frame = camera.read()
+    return frame
+
+
+def grabber_take(grabber, flash):
+    """hubear.take_photo: settle frames are counted from the last LED change, during the flash's final pause."""
+    lights_off = threading.Event()
+    thread = threading.Thread(target=flash, args=(lights_off,))
+    thread.start()
+    lights_off.wait()
+    frame = grabber.capture(SETTLE_FRAMES)
+    thread.join()
+    return frame
+
+
+def run(take, camera, target, flash, lights_off_at, shots, gap):
+    rows = []
+    for _ in range(shots):
+        # Idle between shots, so the camera buffer fills up as it would on the Pi
+        time.sleep(gap)
+        start = time.monotonic()
+        frame = take(target, flash)
+        done = time.monotonic()
+        produced = camera.produced_at(frame)
+        rows.append((done - start, done - produced, produced >= start + lights_off_at))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shots", type=int, default=10)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--gap", type=float, default=0.5, help="idle seconds between shots")
+    parser.add_argument("--flash-times", type=int, default=3)
+    parser.add_argument("--flash-delay", type=float, default=0.1)
+    args = parser.parse_args()
+    flash_seconds = args.flash_times * 2 * args.flash_delay
+    lights_off_at = flash_seconds - args.flash_delay
+
+    def flash(lights_off=None):
+        simulated_flash(args.flash_times, args.flash_delay, lights_off)
+
+    results = {}
+    camera = FakeCamera(fps=args.fps)
+    results["legacy"] = run(legacy_take, camera, camera, flash, lights_off_at, args.shots, args.gap)
+    camera = FakeCamera(fps=args.fps)
+    grabber = FrameGrabber(camera).start()
+    try:
+        results["grabber"] = run(grabber_take, camera, grabber, flash, lights_off_at, args.shots, args.gap)
+    finally:
+        grabber.stop()
+
+    print(f"flash {flash_seconds:.2f}s (LEDs off for good at {lights_off_at:.2f}s), {args.fps} fps")
+    print(f"{'mode':<9}{'trigger to frame (ms)':<23}{'frame age (ms)':<16}{'post-flash':<10}")
+    for mode, rows in results.items():
+        latency = statistics.mean(r[0] for r in rows)
+        age = statistics.mean(r[1] for r in rows)
+        post_flash = sum(r[2] for r in rows)
+        print(f"{mode:<9}{latency * 1000:<23.0f}{age * 1000:<16.0f}{post_flash}/{len(rows):<8}")
+
+
+if __name__ == "__main__":
+    main()
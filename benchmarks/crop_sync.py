@@ -0,0 +1,73 @@
+"""Crop directory update: delete-all-then-rewrite versus incremental versioned sync.
+
+Publishes N crops, then applies a diff that deletes 10%, renumbers the rest
+(carrying their crops over) and adds 10%, and reports time and bytes written.
+
+    python -m benchmarks.crop_sync --sizes 10 100 1000 --crop-kb 40
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.services.crop_store import sync_crop_dir
+
+
+def legacy_update(live_dir, images, carried):
+    """The original step 7: read carried crops, clear the directory, write every crop."""
+    os.makedirs(live_dir, exist_ok=True)
+    images = dict(images)
+    for name, old_name in carried.items():
+        with open(os.path.join(live_dir, old_name), 'rb') as f:
+            images[name] = f.read()
+    for name in os.listdir(live_dir):
+        os.remove(os.path.join(live_dir, name))
+    written = 0
+    for name, data in images.items():
+        with open(os.path.join(live_dir, name), 'wb') as f:
+            f.write(data)
+        written += len(data)
+    return {"bytes_written": written}
+
+
+def make_diff(n, crop_bytes, rng):
+    old_ids = list(range(n))
+    rng.shuffle(old_ids)
+    kept = old_ids[n // 10:]
+    new_ids = list(range(len(kept) + n // 10))
+    rng.shuffle(new_ids)
+    carried = {f"object_{new}.png": f"object_{old}.png" for old, new in zip(kept, new_ids)}
+    added = {f"object_{new}.png": os.urandom(crop_bytes) for new in new_ids[len(kept):]}
+    return added, carried
+
+
+def run_once(update, n, crop_bytes, diff, tmp_dir):
+    live_dir = os.path.join(tmp_dir, f"{update.__name__}_{n}", "ind_images")
+    os.makedirs(os.path.dirname(live_dir))
+    initial = {f"object_{i}.png": os.urandom(crop_bytes) for i in range(n)}
+    update(live_dir, initial, {})
+    start = time.perf_counter()
+    stats = update(live_dir, *diff)
+    return time.perf_counter() - start, stats["bytes_written"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--crop-kb", type=int, default=40)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    crop_bytes = args.crop_kb * 1024
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'crops':<7}{'legacy (ms)':<13}{'legacy KB':<11}{'sync (ms)':<11}{'sync KB':<9}")
+        for n in args.sizes:
+            diff = make_diff(n, crop_bytes, rng)
+            legacy_time, legacy_bytes = run_once(legacy_update, n, crop_bytes, diff, tmp_dir)
+            sync_time, sync_bytes = run_once(sync_crop_dir, n, crop_bytes, diff, tmp_dir)
+            print(f"{n:<7}{legacy_time * 1000:<13.1f}{legacy_bytes // 1024:<11}{sync_time * 1000:<11.1f}{sync_bytes // 1024:<9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Detection result upload: zipped result directory versus JSON diff with only the added crops.
+
+Builds a result of N objects from the crops in object_detection/result, in
+which --added of them are new and the rest matched, and posts it both ways
+to a local stub backend, as object_detection/app.py does. Reports request
+body size and loopback latency, plus the transfer time the body would need
+on an --uplink-mbps link (computed from the size, not measured).
+
+    python -m benchmarks.diff_upload --objects 5 20 50 --added 0.1
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import requests
+from aiohttp import web
+
+CROP_SOURCES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "object_detection", "result", "*.png")))
+
+
+def start_stub():
+    async def receive(request):
+        body = await request.read()
+        return web.json_response({"status": "success", "size": len(body)})
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_post("/upload/zip", receive)
+    app.router.add_post("/upload/diff", receive)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    ready = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{port}"
+
+
+def make_result(result_dir, n, added):
+    """Write a result dir like process_image leaves it; returns (manifest, crops)."""
+    json_dir = os.path.join(result_dir, "json")
+    os.makedirs(json_dir)
+    sources = []
+    for path in CROP_SOURCES:
+        with open(path, "rb") as f:
+            sources.append(f.read())
+    new_json, crops = [], {}
+    for i in range(n):
+        name = f"object_{i}.png"
+        crops[name] = sources[i % len(sources)]
+        with open(os.path.join(result_dir, name), "wb") as f:
+            f.write(crops[name])
+        new_json.append({"object_id": i, "image_path": f"./result/{name}", "bounding_box": [0, 0, 100, 100]})
+    n_added = max(1, round(n * added)) if added else 0
+    manifest = {
+        "new": new_json,
+        "match": [{"old_object_id": i, "new_object_id": i} for i in range(n - n_added)],
+        "delete": [],
+        "add": [{"new_object_id": i, "bounding_box": [0, 0, 100, 100]} for i in range(n - n_added, n)],
+    }
+    for key in ("new", "match", "delete", "add"):
+        with open(os.path.join(json_dir, f"{key}.json"), "w") as f:
+            json.dump(manifest[key], f)
+    with open(os.path.join(json_dir, "old.json"), "w") as f:
+        json.dump(new_json, f)
+    return manifest, crops
+
+
+def zip_upload(session, url, result_dir, work_dir):
+    """upload_results: zip the whole result dir and post it."""
+    start = time.perf_counter()
+    archive = shutil.make_archive(os.path.join(work_dir, "data"), "zip", result_dir)
+    with open(archive, "rb") as f:
+        prepared = requests.Request("POST", f"{url}/upload/zip", files={"file": ("data.zip", f, "application/zip")}).prepare()
+    session.send(prepared).raise_for_status()
+    return len(prepared.body), time.perf_counter() - start
+
+
+def diff_upload(session, url, manifest, crops):
+    """upload_diff: the manifest and the crops of added objects."""
+    start = time.perf_counter()
+    added = {entry["new_object_id"] for entry in manifest["add"]}
+    files = [("crops", (f"object_{i}.png", crops[f"object_{i}.png"], "image/png")) for i in sorted(added)]
+    prepared = requests.Request("POST", f"{url}/upload/diff", data={"manifest": json.dumps(manifest)}, files=files).prepare()
+    session.send(prepared).raise_for_status()
+    return len(prepared.body), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--added", type=float, default=0.1, help="fraction of objects that are new")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--uplink-mbps", type=float, default=20)
+    args = parser.parse_args()
+    url = start_stub()
+
+    print(f"{'objects':<9}{'mode':<6}{'body (KB)':<11}{'loopback (ms)':<15}{f'at {args.uplink_mbps:g} Mbps (ms)':<18}")
+    with requests.Session() as session:
+        for n in args.objects:
+            with tempfile.TemporaryDirectory() as work_dir:
+                result_dir = os.path.join(work_dir, "result")
+                manifest, crops = make_result(result_dir, n, args.added)
+                runs = {
+                    "zip": [zip_upload(session, url, result_dir, work_dir) for _ in range(args.repeat)],
+                    "diff": [diff_upload(session, url, manifest, crops) for _ in range(args.repeat)],
+                }
+            for mode, results in runs.items():
+                size = results[0][0]
+                latency = statistics.median(r[1] for r in results)
+                transfer = size * 8 / (args.uplink_mbps * 1e6)
+                print(f"{n:<9}{mode:<6}{size / 1024:<11.1f}{latency * 1000:<15.1f}{transfer * 1000:<18.0f}")
+
+
+if __name__ == "__main__":
+    main()
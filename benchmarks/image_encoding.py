@@ -0,0 +1,100 @@
+"""Payload size and request latency of crop encodings for the vision model.
+
+Compares sending a crop by URL against inline base64 data URLs at several
+sizes and qualities. By default requests go to the local fake endpoint from
+benchmarks.labeling; pass --real to call the OpenAI API with OPENAI_API_KEY.
+
+    python -m benchmarks.image_encoding --images app/static/ind_images
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import tempfile
+import time
+
+from openai import AsyncOpenAI
+
+from app.services.labeling_service import LABEL_MODEL, LABEL_PROMPT, crop_image_url, inline_image_url, parse_label
+from benchmarks.labeling import make_crops, start_fake_endpoint
+
+# (name, max_edge, format, quality); None means the URL mode
+ENCODINGS = [
+    ("url", None, None, None),
+    ("png-512", 512, "png", None),
+    ("jpeg-512-q85", 512, "jpeg", 85),
+    ("jpeg-384-q70", 384, "jpeg", 70),
+    ("webp-512-q80", 512, "webp", 80),
+    ("webp-256-q70", 256, "webp", 70),
+]
+
+
+def build_input(image_url):
+    return [
+        {"role": "user", "content": LABEL_PROMPT},
+        {"role": "user", "content": [{"type": "input_image", "image_url": image_url}]}
+    ]
+
+
+async def run(args):
+    tmp_dir = None
+    if args.images:
+        paths = []
+        for path in args.images:
+            paths.extend(sorted(glob.glob(os.path.join(path, "object_*"))) if os.path.isdir(path) else [path])
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        paths = list(make_crops(tmp_dir.name, 5, size=(600, 800)).values())
+
+    runner = None
+    if args.real:
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    else:
+        runner, base_url, _ = await start_fake_endpoint(args.delay)
+        client = AsyncOpenAI(api_key="fake", base_url=base_url, max_retries=0)
+
+    try:
+        print(f"{'encoding':<15}{'avg payload (KB)':<18}{'avg encode (ms)':<17}{'avg request (s)':<16}{'parsed':<7}")
+        for name, max_edge, fmt, quality in ENCODINGS:
+            sizes, encode_times, request_times, parsed = [], [], [], 0
+            for path in paths:
+                start = time.perf_counter()
+                if max_edge is None:
+                    image_url = crop_image_url(path)
+                else:
+                    image_url = inline_image_url(path, max_edge=max_edge, fmt=fmt, quality=quality)
+                encode_times.append(time.perf_counter() - start)
+                payload = build_input(image_url)
+                sizes.append(len(json.dumps(payload)))
+
+                start = time.perf_counter()
+                try:
+                    response = await client.responses.create(model=LABEL_MODEL, input=payload)
+                    parse_label(response.output_text)
+                    parsed += 1
+                except Exception as e:
+                    print(f"[WARN] {name} {os.path.basename(path)}: {e!r}")
+                request_times.append(time.perf_counter() - start)
+            n = len(paths)
+            print(f"{name:<15}{sum(sizes) / n / 1024:<18.1f}{sum(encode_times) / n * 1000:<17.1f}"
+                  f"{sum(request_times) / n:<16.3f}{parsed}/{n}")
+    finally:
+        await client.close()
+        if runner:
+            await runner.cleanup()
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", nargs="+", help="crop files or directories (default: synthetic crops)")
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds the fake endpoint takes per request")
+    parser.add_argument("--real", action="store_true", help="call the OpenAI API instead of the fake endpoint")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
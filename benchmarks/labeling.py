@@ -0,0 +1,120 @@
+"""Crop labeling against a local fake vision endpoint.
+
+Starts an aiohttp server that mimics the OpenAI Responses API with a fixed
+delay per request, then labels the same set of crops sequentially
+(concurrency 1), with the configured concurrency limit, and in batched
+structured-output requests.
+
+    python -m benchmarks.labeling --crops 20 --delay 0.5 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from aiohttp import web
+from openai import AsyncOpenAI
+from PIL import Image
+
+from app.services.labeling_service import label_crops
+
+
+def fake_response(text):
+    return {
+        "id": "resp_fake",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": "fake-vision",
+        "output": [{
+            "type": "message",
+            "id": "msg_fake",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}]
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": []
+    }
+
+
+async def start_fake_endpoint(delay, port=0):
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+
+    async def responses(request):
+        body = await request.json()
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            stats["in_flight"] -= 1
+        label = {"name": "apple", "category": "fruit", "expiry_date": None, "status": "fresh"}
+        if body.get("text", {}).get("format", {}).get("type") == "json_schema":
+            # Batched request: answer every "temp_object_id: N" marker in the input
+            ids = [
+                int(part["text"].split(":", 1)[1])
+                for part in body["input"][0]["content"]
+                if part["type"] == "input_text" and part["text"].startswith("temp_object_id:")
+            ]
+            items = [{"temp_object_id": i, **label} for i in ids]
+            return web.json_response(fake_response(json.dumps({"items": items})))
+        return web.json_response(fake_response(json.dumps(label)))
+
+    app = web.Application()
+    app.router.add_post("/v1/responses", responses)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1", stats
+
+
+def make_crops(directory, count, size=(240, 320)):
+    """Write `count` synthetic crops (random noise, so each has its own hash) to directory."""
+    crops = {}
+    for i in range(count):
+        path = os.path.join(directory, f"object_{i}.png")
+        Image.effect_noise(size, 40 + i).convert("RGB").save(path)
+        crops[i] = path
+    return crops
+
+
+async def run(args):
+    runner, base_url, stats = await start_fake_endpoint(args.delay)
+    client = AsyncOpenAI(api_key="fake", base_url=base_url, max_retries=0)
+    tmp_dir = tempfile.TemporaryDirectory()
+    crops = make_crops(tmp_dir.name, args.crops)
+    try:
+        print(f"{'concurrency':<13}{'batch size':<12}{'wall (s)':<10}{'labeled':<9}{'requests':<10}{'max in flight':<14}")
+        for concurrency, batch_size in ((1, 1), (args.concurrency, 1), (args.concurrency, args.batch_size)):
+            stats["max_in_flight"] = 0
+            stats["requests"] = 0
+            start = time.perf_counter()
+            labels = await label_crops(crops, client=client, concurrency=concurrency, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            labeled = sum(1 for label in labels.values() if label)
+            print(f"{concurrency:<13}{batch_size:<12}{elapsed:<10.2f}{labeled:<9}{stats['requests']:<10}{stats['max_in_flight']:<14}")
+    finally:
+        await client.close()
+        await runner.cleanup()
+        tmp_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--crops", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds the fake endpoint takes per request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Fridge camera monitoring against a local stub of /fridge/image.
+
+Runs FridgeCamera.monitor with a FakeCamera whose frames change at chosen
+shots, and a stub backend that answers "no_change" for a repeated frame,
+fails the first --failures requests with HTTP 500 and is --upload-delay
+slow. Intervals are in seconds and scaled down so a run takes a few
+seconds. Prints each shot's outcome and the interval that followed, and
+how many connections the uploads used.
+
+    python -m benchmarks.monitor --shots 12 --changes 0 5 --failures 2
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+from aiohttp import web
+
+from app.camera.camera_service import FakeCamera, FridgeCamera
+
+
+def build_stub(failures, upload_delay):
+    state = {"last": None, "failures": failures, "peers": set(), "log": []}
+
+    async def fridge_image(request):
+        state["peers"].add(request.transport.get_extra_info("peername"))
+        form = await request.post()
+        data = form["file"].file.read()
+        await asyncio.sleep(upload_delay)
+        if state["failures"]:
+            state["failures"] -= 1
+            state["log"].append((time.monotonic(), "error"))
+            return web.json_response({"detail": "stub failure"}, status=500)
+        status = "no_change" if data == state["last"] else "success"
+        state["last"] = data
+        state["log"].append((time.monotonic(), status))
+        return web.json_response({"status": status})
+
+    app = web.Application()
+    app.router.add_post("/fridge/image", fridge_image)
+    return app, state
+
+
+class RecordingCamera(FridgeCamera):
+    """FridgeCamera that notes the interval chosen after each upload."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.intervals = []
+
+    def _schedule(self, interval):
+        super()._schedule(interval)
+        self.intervals.append(interval)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_frames(shots, changes):
+    frames, version = [], 0
+    for shot in range(shots):
+        if shot in changes:
+            version += 1
+        frames.append(f"frame-{version}".encode())
+    return frames
+
+
+async def run(args):
+    app, state = build_stub(args.failures, args.upload_delay)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    camera = FakeCamera(make_frames(args.shots, set(args.changes)), capture_seconds=args.capture_seconds)
+    monitor = RecordingCamera(camera=camera, api_url=f"http://127.0.0.1:{port}", interval=args.interval,
+                              active_interval=args.active_interval, idle_interval=args.idle_interval,
+                              backoff=args.backoff, max_backoff=args.idle_interval)
+
+    async def watch():
+        while camera.captures < args.shots:
+            await asyncio.sleep(0.005)
+        monitor.stop()
+
+    start = time.monotonic()
+    try:
+        await asyncio.gather(monitor.monitor(), watch())
+    finally:
+        await runner.cleanup()
+
+    print(f"{'t (s)':<8}{'reply':<12}{'next interval (s)':<18}")
+    for (at, status), interval in zip(state["log"], monitor.intervals):
+        print(f"{at - start:<8.2f}{status:<12}{interval:<18.2f}")
+    print(f"monitor: {monitor.counts}")
+    print(f"connections used: {len(state['peers'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shots", type=int, default=12)
+    parser.add_argument("--changes", type=int, nargs="*", default=[0, 5], help="shots at which the fridge changes")
+    parser.add_argument("--failures", type=int, default=2, help="requests the stub fails first")
+    parser.add_argument("--upload-delay", type=float, default=0.05)
+    parser.add_argument("--capture-seconds", type=float, default=0.05)
+    parser.add_argument("--interval", type=float, default=0.4)
+    parser.add_argument("--active-interval", type=float, default=0.1)
+    parser.add_argument("--idle-interval", type=float, default=0.8)
+    parser.add_argument("--backoff", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Detection diff reconciliation: per-row queries versus set-based statements.
+
+Runs against a throwaway SQLite database. Each fridge of N objects gets a diff
+that deletes 10%, renumbers 80% (shuffled, so ids are swapped) and adds 10%.
+
+    python -m benchmarks.reconcile --sizes 10 100 1000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base, FoodItem
+from app.services.fridge_service import reconcile_detection_diff
+
+
+def legacy_reconcile(db, match_json, delete_json, add_json):
+    """The original process_zip_file steps 4-6: one query per entry and three commits."""
+    for entry in delete_json:
+        item = db.query(FoodItem).filter(FoodItem.temp_object_id == entry['old_object_id']).first()
+        if item:
+            db.delete(item)
+    db.commit()
+    for entry in match_json:
+        item = db.query(FoodItem).filter(FoodItem.temp_object_id == entry['old_object_id']).first()
+        if item:
+            item.temp_object_id = entry['new_object_id']
+    db.commit()
+    for entry in add_json:
+        new_id = entry['new_object_id']
+        db.add(FoodItem(temp_object_id=new_id, name=f"Object {new_id}", category="unknown", status="fresh"))
+    db.commit()
+
+
+def bulk_reconcile(db, match_json, delete_json, add_json):
+    reconcile_detection_diff(db, match_json, delete_json, add_json)
+    db.commit()
+
+
+def make_diff(n, rng):
+    old_ids = list(range(n))
+    rng.shuffle(old_ids)
+    n_delete = n // 10
+    n_add = n // 10
+    deleted = old_ids[:n_delete]
+    matched = old_ids[n_delete:]
+    # New ids are a shuffled renumbering, so many matches swap ids with each other
+    new_ids = list(range(len(matched) + n_add))
+    rng.shuffle(new_ids)
+    match_json = [{'old_object_id': old, 'new_object_id': new} for old, new in zip(matched, new_ids)]
+    add_json = [{'new_object_id': new} for new in new_ids[len(matched):]]
+    delete_json = [{'old_object_id': old} for old in deleted]
+    return match_json, delete_json, add_json
+
+
+def expected_rows(match_json, add_json):
+    # Rows start out named after their old id, so renumbered rows keep the old name
+    rows = [(f"Object {entry['old_object_id']}", entry['new_object_id']) for entry in match_json]
+    rows += [(f"Object {entry['new_object_id']}", entry['new_object_id']) for entry in add_json]
+    return sorted(rows)
+
+
+def run_once(reconcile, n, diff, tmp_dir):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, f'{reconcile.__name__}_{n}.db')}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        db.add_all([FoodItem(temp_object_id=i, name=f"Object {i}", category="unknown", status="fresh") for i in range(n)])
+        db.commit()
+        start = time.perf_counter()
+        reconcile(db, *diff)
+        elapsed = time.perf_counter() - start
+        rows = sorted((item.name, item.temp_object_id) for item in db.query(FoodItem).all())
+    finally:
+        db.close()
+        engine.dispose()
+    return elapsed, rows == expected_rows(diff[0], diff[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'objects':<9}{'legacy (ms)':<13}{'correct':<9}{'bulk (ms)':<11}{'correct':<9}{'speedup':<8}")
+        for n in args.sizes:
+            diff = make_diff(n, rng)
+            legacy_time, legacy_ok = run_once(legacy_reconcile, n, diff, tmp_dir)
+            bulk_time, bulk_ok = run_once(bulk_reconcile, n, diff, tmp_dir)
+            print(f"{n:<9}{legacy_time * 1000:<13.1f}{str(legacy_ok):<9}{bulk_time * 1000:<11.1f}{str(bulk_ok):<9}"
+                  f"{legacy_time / bulk_time:<8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""LINE webhook latency: handling events inline versus acknowledging and dispatching them.
+
+Serves two copies of the webhook with uvicorn, both using a real
+WebhookHandler with a text handler that blocks for --work seconds (like the
+bot's HTTP, database and OpenAI calls). "inline" calls handler.handle inside
+the async endpoint, as /webhook used to; "dispatched" goes through
+WebhookDispatcher. Concurrent users each send a sequence of signed messages.
+
+    python -m benchmarks.webhook --users 20 --messages 5 --work 0.2
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import socket
+import threading
+import time
+
+import aiohttp
+import uvicorn
+from fastapi import FastAPI, Request
+from linebot import WebhookHandler
+from linebot.models import MessageEvent, TextMessage
+
+from app.line_bot.dispatcher import WebhookDispatcher
+
+SECRET = "benchmark-secret"
+
+
+def make_body(user_id, seq):
+    return json.dumps({
+        "destination": "Ubenchmark",
+        "events": [{
+            "type": "message",
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "source": {"type": "user", "userId": user_id},
+            "webhookEventId": f"{user_id}-{seq}",
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": f"reply-{user_id}-{seq}",
+            "message": {"id": str(seq), "type": "text", "text": str(seq)},
+        }]
+    })
+
+
+def sign(body):
+    digest = hmac.new(SECRET.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def build_app(work, workers):
+    handler = WebhookHandler(SECRET)
+    handled = []
+    handled_lock = threading.Lock()
+
+    @handler.add(MessageEvent, message=TextMessage)
+    def handle_text(event):
+        time.sleep(work)
+        with handled_lock:
+            handled.append((event.source.user_id, int(event.message.text)))
+
+    dispatcher = WebhookDispatcher(handler, SECRET, max_workers=workers)
+    app = FastAPI()
+
+    @app.post("/inline")
+    async def inline(request: Request):
+        body = await request.body()
+        handler.handle(body.decode(), request.headers.get("X-Line-Signature", ""))
+        return {"status": "ok"}
+
+    @app.post("/dispatched")
+    async def dispatched(request: Request):
+        body = await request.body()
+        dispatcher.dispatch(body.decode(), request.headers.get("X-Line-Signature", ""))
+        return {"status": "ok"}
+
+    return app, dispatcher, handled
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def run_load(url, users, messages):
+    latencies = []
+
+    async def user(session, index):
+        user_id = f"U{index:04d}"
+        for seq in range(messages):
+            body = make_body(user_id, seq)
+            start = time.perf_counter()
+            async with session.post(url, data=body, headers={
+                "Content-Type": "application/json",
+                "X-Line-Signature": sign(body),
+            }) as response:
+                await response.read()
+                assert response.status == 200, response.status
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(user(session, i) for i in range(users)))
+    return latencies
+
+
+def in_order(handled):
+    last = {}
+    for user_id, seq in handled:
+        if seq <= last.get(user_id, -1):
+            return False
+        last[user_id] = seq
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5, help="messages per user, sent one after another")
+    parser.add_argument("--work", type=float, default=0.2, help="seconds each event handler blocks")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    app, dispatcher, handled = build_app(args.work, args.workers)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    total = args.users * args.messages
+    print(f"{'mode':<12}{'p50 (ms)':<10}{'p99 (ms)':<10}{'max (ms)':<10}{'all handled (s)':<17}{'per-user order':<15}")
+    try:
+        for mode in ("inline", "dispatched"):
+            handled.clear()
+            start = time.perf_counter()
+            latencies = asyncio.run(run_load(f"http://127.0.0.1:{port}/{mode}", args.users, args.messages))
+            while len(handled) < total:
+                time.sleep(0.01)
+            done = time.perf_counter() - start
+            print(f"{mode:<12}{percentile(latencies, 50) * 1000:<10.1f}{percentile(latencies, 99) * 1000:<10.1f}"
+                  f"{max(latencies) * 1000:<10.1f}{done:<17.2f}{str(in_order(handled)):<15}")
+    finally:
+        server.should_exit = True
+        thread.join()
+    print(f"dispatcher: {dispatcher.executor.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import struct
+import threading
+import time
+
+import numpy as np
+
+# Frames read after a capture is requested before one is returned, so the exposure
+# has adapted to the light at that moment (and no frame started before the request)
+SETTLE_FRAMES = 2
+
+
+class FrameGrabber:
+    """Reads frames from a camera on a background thread and keeps only the latest one.
+
+    `camera` is anything with the cv2.VideoCapture read() interface. Because
+    frames are consumed continuously, the driver's buffer never holds stale
+    frames and the exposure keeps tracking the scene between shots.
+    """
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.frame_count = 0
+        self.failures = 0
+        self._frame = None
+        self._frame_time = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="frame-grabber")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            ret, frame = self.camera.read()
+            if not ret:
+                self.failures += 1
+                time.sleep(0.01)
+                continue
+            with self._cond:
+                self._frame = frame
+                self._frame_time = time.monotonic()
+                self.frame_count += 1
+                self._cond.notify_all()
+
+    def latest(self):
+        """The most recent frame and the monotonic time it was read, or (None, None) before the first."""
+        with self._cond:
+            return self._frame, self._frame_time
+
+    def capture(self, settle_frames=SETTLE_FRAMES, timeout=2.0):
+        """Return the `settle_frames`-th frame read after this call. Raises TimeoutError if none arrives."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self.frame_count + settle_frames
+            while self.frame_count < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No frame from the camera")
+                self._cond.wait(remaining)
+            return self._frame
+
+
+class FakeCamera:
+    """Stand-in for cv2.VideoCapture, for benchmarks and running without a camera.
+
+    Frames are produced at `fps` whether or not they are read, and like a
+    V4L2 device the newest `buffer_size` of them are buffered, so infrequent
+    reads return old frames. The production time of each frame is stamped
+    into its first bytes (see `produced_at`).
+    """
+
+    def __init__(self, width=640, height=480, fps=30, buffer_size=4):
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps
+        self.buffer_size = buffer_size
+        self.start = time.monotonic()
+        self.next_index = 0
+
+    def read(self):
+        now = time.monotonic()
+        newest = int((now - self.start) / self.interval)
+        index = max(self.next_index, newest - self.buffer_size + 1)
+        if index > newest:
+            time.sleep(self.start + index * self.interval - now)
+        self.next_index = index + 1
+        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        frame.reshape(-1)[:8] = np.frombuffer(struct.pack('<d', self.start + index * self.interval), dtype=np.uint8)
+        return True, frame
+
+    @staticmethod
+    def produced_at(frame):
+        """Monotonic time a FakeCamera frame was produced."""
+        return struct.unpack('<d', frame.reshape(-1)[:8].tobytes())[0]
+
+    def set(self, prop, value):
+        return True
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
@@ -4,11 +4,13 @@ import RPi.GPIO as GPIO
 import cv2
 import time
 import os
-import subprocess
+import requests
 # Add Flask imports
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 import threading
 
+from frame_grabber import FakeCamera, FrameGrabber
+
 #LED
 NUM_PIXELS = 8
 pixels = neopixel.NeoPixel(board.D18, NUM_PIXELS, brightness=0.3, auto_write=True)
@@ -23,6 +25,10 @@ API = "https://dae2-140-112-25-46.ngrok/"
 API_TAKE_PHOTO = "api/check-take-photo"
 API_SET_TAKE_PHOTO = "api/check-set-take-photo"
 API_SEND_PHOTO = "fridge/image"
+# Commands for this device are long-polled from the backend
+DEVICE_ID = os.getenv("DEVICE_ID", "default")
+API_COMMANDS = f"devices/{DEVICE_ID}/commands"
+COMMAND_WAIT = 25
 
 #take photo detect
 WATCH_DIR = "~"
@@ -31,56 +37,106 @@ TRIGGER_NAME = "take_photo.trigger"
 #save picture 
 SAVE_DIR = "/home/team5/i_fridge/photo"
 os.makedirs(SAVE_DIR, exist_ok=True)
-
-#camera initialize
-cam = cv2.VideoCapture(0)
-cam.set(cv2.CAP_PROP_FRAME_WIDTH, 1080)
-cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+# Photos are only written to SAVE_DIR when archiving is on
+ARCHIVE_PHOTOS = os.getenv("ARCHIVE_PHOTOS", "0") == "1"
+
+#upload encoding: JPEG quality and maximum width (0 keeps the camera resolution)
+UPLOAD_JPEG_QUALITY = int(os.getenv("UPLOAD_JPEG_QUALITY", "85"))
+UPLOAD_MAX_WIDTH = int(os.getenv("UPLOAD_MAX_WIDTH", "0"))
+# Reused for every upload, so the connection (and TLS session) stays open between shots
+upload_session = requests.Session()
+
+#camera initialize (FAKE_CAMERA=1 runs without a camera attached)
+if os.getenv("FAKE_CAMERA", "0") == "1":
+    cam = FakeCamera(width=1080, height=720)
+else:
+    cam = cv2.VideoCapture(0)
+    cam.set(cv2.CAP_PROP_FRAME_WIDTH, 1080)
+    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+# Reads frames continuously, so a shot never waits on stale buffered frames
+grabber = FrameGrabber(cam).start()
 
 previous_state = GPIO.input(BUTTON_PIN)
 
 #LED flash
-def flash_led(times=3, color=(255, 255, 255), delay=0.1):
-    for _ in range(times):
+def flash_led(times=3, color=(255, 255, 255), delay=0.1, lights_off=None):
+    for i in range(times):
         pixels.fill(color)
         time.sleep(delay)
         pixels.fill((0, 0, 0))
+        # Set once the LEDs are off for good, so a capture can start during the final pause
+        if lights_off and i == times - 1:
+            lights_off.set()
         time.sleep(delay)
 
-def take_photo():
-    flash_led(times=3, color=(255,255,255), delay=0.1)
-    for _ in range(5):
-        cam.read()
-        time.sleep(0.05)
-
-    ret, frame = cam.read()
-    if ret:
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        filename = os.path.join(SAVE_DIR, f"photo_{timestamp}.jpg")
-        cv2.imwrite(filename, frame)
+def resize_for_upload(frame):
+    height, width = frame.shape[:2]
+    if UPLOAD_MAX_WIDTH and width > UPLOAD_MAX_WIDTH:
+        scale = UPLOAD_MAX_WIDTH / width
+        frame = cv2.resize(frame, (UPLOAD_MAX_WIDTH, int(height * scale)), interpolation=cv2.INTER_AREA)
+    return frame
+
+def archive_photo(filename, jpeg_bytes):
+    with open(os.path.join(SAVE_DIR, filename), "wb") as f:
+        f.write(jpeg_bytes)
+
+def take_photo(capture_id=None):
+    triggered = time.perf_counter()
+    # The flash's last pause overlaps with the exposure settling after the LEDs go off
+    lights_off = threading.Event()
+    flash = threading.Thread(target=flash_led, kwargs={"lights_off": lights_off}, daemon=True)
+    flash.start()
+    lights_off.wait()
+    try:
+        frame = grabber.capture()
+    except TimeoutError:
+        print("Failed to capture frame")
+        return
+    finally:
+        flash.join()
+    captured = time.perf_counter()
+
+    # Encode in memory; the same bytes are uploaded and, optionally, archived
+    ok, encoded = cv2.imencode(".jpg", resize_for_upload(frame), [cv2.IMWRITE_JPEG_QUALITY, UPLOAD_JPEG_QUALITY])
+    if not ok:
+        print("Failed to encode frame")
+        return
+    jpeg_bytes = encoded.tobytes()
+    encoded_at = time.perf_counter()
+    filename = f"photo_{time.strftime('%Y%m%d-%H%M%S')}.jpg"
+    if ARCHIVE_PHOTOS:
+        threading.Thread(target=archive_photo, args=(filename, jpeg_bytes), daemon=True).start()
 
     try:
-        result = subprocess.run(
-                ["curl", "-F", f"file=@{filename}", API+API_SEND_PHOTO],
-                check = True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-                )
+        # The capture id ties the upload to the request that asked for it
+        data = {"capture_id": capture_id} if capture_id else {}
+        response = upload_session.post(
+            API + API_SEND_PHOTO,
+            files={"file": (filename, jpeg_bytes, "image/jpeg")},
+            data=data,
+            timeout=(5, 60)
+        )
+        response.raise_for_status()
+        acknowledged = time.perf_counter()
         print("upload successfully")
-        print("server reply: ", result.stdout)
+        print("server reply: ", response.text)
+        print(f"{len(jpeg_bytes)} bytes, trigger to frame {(captured - triggered) * 1000:.0f} ms, "
+              f"encode {(encoded_at - captured) * 1000:.0f} ms, "
+              f"capture to acknowledged {(acknowledged - captured) * 1000:.0f} ms")
 
-    except subprocess.CalledProcessError as e:
+    except requests.RequestException as e:
         print("Failed to Upload")
-        print(e.stderr)
+        print(e)
 
 # --- Flask server setup ---
 app = Flask(__name__)
 
 @app.route("/trigger-photo", methods=["GET"])
 def trigger_photo():
-    threading.Thread(target=take_photo, daemon=True).start()
-    return jsonify({"status": "photo process started"})
+    capture_id = request.args.get("capture_id")
+    threading.Thread(target=take_photo, args=(capture_id,), daemon=True).start()
+    return jsonify({"status": "photo process started", "capture_id": capture_id})
 
 def run_server():
     app.run(host="0.0.0.0", port=8000, debug=False, use_reloader=False)
@@ -90,6 +146,26 @@ server_thread = threading.Thread(target=run_server, daemon=True)
 server_thread.start()
 # --- End Flask server setup ---
 
+# --- Command listener ---
+def listen_for_commands():
+    """Long-poll the backend; each request returns as soon as a command is queued."""
+    while True:
+        try:
+            response = requests.get(API + API_COMMANDS, params={"wait": COMMAND_WAIT}, timeout=COMMAND_WAIT + 10)
+            response.raise_for_status()
+            for command in response.json()["commands"]:
+                print("command: ", command["command"])
+                if command["command"] == "take_photo":
+                    payload = command.get("payload") or {}
+                    threading.Thread(target=take_photo, args=(payload.get("capture_id"),), daemon=True).start()
+        except Exception as e:
+            print("Command poll failed: ", e)
+            time.sleep(5)
+
+command_thread = threading.Thread(target=listen_for_commands, daemon=True)
+command_thread.start()
+# --- End command listener ---
+
 print("Start runnung...")
 
 try:
@@ -119,6 +195,7 @@ try:
 
 except KeyboardInterrupt:
     print("Exit requested")
+    grabber.stop()
     cam.release()
     pixels.fill((0,0,0))
     GPIO.cleanup()
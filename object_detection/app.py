@@ -3,10 +3,15 @@ import os
 import requests
 import shutil
 import json
+import time
+import cv2
 from werkzeug.utils import secure_filename
-from object_detection import detect_objects
+from object_detection import save_detections, GroundingDinoDetector, CROP_FORMATS
 from change_detection import check_matching_objects
-from threading import Thread
+from batching import MicroBatcher
+from roi import detect_incremental
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
 
 app = Flask(__name__)
 
@@ -19,9 +24,99 @@ os.makedirs(JSON_DIR, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Configuration
-UPLOAD_URL = 'https://f478-140-112-24-61.ngrok-free.app/upload/zip'
+BACKEND_URL = os.getenv('BACKEND_URL', 'https://f478-140-112-24-61.ngrok-free.app')
+UPLOAD_URL = f'{BACKEND_URL}/upload/zip'
+# Structured ingest: JSON diff plus only the crops the backend does not have yet
+DIFF_UPLOAD_URL = f'{BACKEND_URL}/upload/diff'
+# Detector backend: device is cuda/cpu/auto, precision is fp32/fp16/bf16/int8
+DETECTOR_DEVICE = os.getenv('DETECTOR_DEVICE', 'auto')
+DETECTOR_PRECISION = os.getenv('DETECTOR_PRECISION', 'fp32')
+DETECTOR_THREADS = int(os.getenv('DETECTOR_THREADS', '0')) or None
+# Micro-batching: images arriving within BATCH_MAX_WAIT seconds share one forward pass
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT = float(os.getenv('BATCH_MAX_WAIT', '0.05'))
+# Crop output encoder (png/jpeg/webp) and quality for the lossy formats
+CROP_FORMAT = os.getenv('CROP_FORMAT', 'png')
+CROP_QUALITY = int(os.getenv('CROP_QUALITY', '90'))
+# Incremental detection: only regions that changed since the previous photo are re-detected,
+# unless they cover more than ROI_MAX_CHANGED of the frame
+ROI_DETECTION = os.getenv('ROI_DETECTION', '0') == '1'
+ROI_MAX_CHANGED = float(os.getenv('ROI_MAX_CHANGED', '0.3'))
+ROI_PAD = int(os.getenv('ROI_PAD', '32'))
+# Set to a directory to dump every candidate crop before NMS, for debugging
+DEBUG_CROP_DIR = os.getenv('DEBUG_CROP_DIR')
+if DEBUG_CROP_DIR:
+    os.makedirs(DEBUG_CROP_DIR, exist_ok=True)
 
-def process_image(img_path):
+# Grounding DINO detector owned by the server, loaded once and reused for every image
+detector = None
+batcher = None
+detector_lock = Lock()
+# Serializes the new.json/old.json rotation, change detection and upload
+result_lock = Lock()
+# Photos are numbered as they arrive and rotate new.json in that order, even when
+# batched detection finishes them out of order
+result_turn = Condition()
+next_ticket = 0
+current_turn = 0
+# Last processed photo (BGR), the reference for incremental detection
+previous_frame = None
+# Processing jobs only wait on the batcher, so this bounds queued work rather than GPU use
+executor = ThreadPoolExecutor(max_workers=BATCH_MAX_SIZE * 2)
+
+def get_detector():
+    global detector
+    with detector_lock:
+        if detector is None:
+            detector = GroundingDinoDetector(
+                device=DETECTOR_DEVICE,
+                precision=DETECTOR_PRECISION,
+                num_threads=DETECTOR_THREADS
+            )
+    return detector
+
+def get_batcher():
+    global batcher
+    detector = get_detector()
+    with detector_lock:
+        if batcher is None:
+            batcher = MicroBatcher(detector, max_batch_size=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT)
+    return batcher
+
+def take_ticket():
+    global next_ticket
+    with result_turn:
+        ticket = next_ticket
+        next_ticket += 1
+        return ticket
+
+def submit_image(img_path):
+    """Queue a photo for processing, numbered in arrival order."""
+    # Taking the ticket and queueing together keeps the executor's queue in ticket order
+    with result_turn:
+        return executor.submit(process_image, img_path, take_ticket())
+
+def wait_for_turn(ticket):
+    with result_turn:
+        result_turn.wait_for(lambda: current_turn == ticket)
+
+def end_turn(ticket):
+    """Let the next photo rotate; waits for this photo's turn first, so a failed photo never skips ahead."""
+    global current_turn
+    with result_turn:
+        result_turn.wait_for(lambda: current_turn == ticket)
+        current_turn += 1
+        result_turn.notify_all()
+
+def process_image(img_path, ticket=None):
+    if ticket is None:
+        ticket = take_ticket()
+    try:
+        return _process_image(img_path, ticket)
+    finally:
+        end_turn(ticket)
+
+def _process_image(img_path, ticket):
     save_dir = './'
     # img_filename = 'fruit.png'  # Remove hardcoded filename
     # img_path = os.path.join(save_dir, img_filename)  # Use provided img_path
@@ -29,17 +124,122 @@ def process_image(img_path):
     json_path = os.path.join(JSON_DIR, 'new.json')
     old_json_path = os.path.join(JSON_DIR, 'old.json')
     
-    # Rename existing new.json to old.json if it exists
+    # Run object detection; images uploaded together are batched by the MicroBatcher
+    image = cv2.imread(img_path)
+    if image is None:
+        return {'error': f'Could not read image {img_path}'}
+    if not ROI_DETECTION:
+        result = get_batcher().detect(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        print("object_detect")
+
+    # Rotate only once every earlier photo has, so new.json always holds the last photo received
+    wait_for_turn(ticket)
+    with result_lock:
+        if ROI_DETECTION:
+            # Needs the previous frame and its objects, so it runs in photo order
+            result = detect_changed(image, json_path)
+            print("object_detect")
+        # Rename existing new.json to old.json if it exists
+        if os.path.exists(json_path):
+            os.rename(json_path, old_json_path)
+        _, crops = save_detections(
+            image, result, json_path, RESULT_DIR,
+            crop_format=CROP_FORMAT, crop_quality=CROP_QUALITY, debug_dir=DEBUG_CROP_DIR
+        )
+        # Run change detection if old.json exists
+        if os.path.exists(old_json_path):
+            check_matching_objects(old_json=old_json_path, new_json=json_path, save_dir=JSON_DIR)
+        print("match check")
+        result = upload_diff(json_path, old_json_path, crops)
+        if 'error' in result:
+            print(f"[upload] diff upload failed ({result['error']}), falling back to zip")
+            result = upload_results()
+        return result
+
+def detect_changed(image, json_path):
+    """Incremental detection of `image` against the previous photo; the caller holds result_lock."""
+    global previous_frame
+    batcher = get_batcher()
+    prev_objects = None
     if os.path.exists(json_path):
-        os.rename(json_path, old_json_path)
-    
-    # Run object detection
-    detect_objects(img_path=img_path, json_path=json_path, save_dir=RESULT_DIR)
-    print("object_detect")
-    # Run change detection if old.json exists
+        with open(json_path, 'r') as f:
+            prev_objects = json.load(f)
+
+    def detect_many(images):
+        # Region crops are submitted together so the batcher runs them as one batch
+        futures = [batcher.submit(img) for img in images]
+        return [future.result() for future in futures]
+
+    result, info = detect_incremental(
+        detect_many, previous_frame, image, prev_objects,
+        max_changed_fraction=ROI_MAX_CHANGED, pad=ROI_PAD
+    )
+    previous_frame = image
+    print(f"[roi] {info}")
+    return result
+
+def build_diff_manifest(json_path, old_json_path):
+    def load_json(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    new_json = load_json(json_path)
     if os.path.exists(old_json_path):
-        check_matching_objects(old_json=old_json_path, new_json=json_path, save_dir=JSON_DIR)
-    print("match check")
+        match_json = load_json(os.path.join(JSON_DIR, 'match.json'))
+        delete_json = load_json(os.path.join(JSON_DIR, 'delete.json'))
+        add_json = load_json(os.path.join(JSON_DIR, 'add.json'))
+    else:
+        # First photo: every detected object is new
+        match_json = []
+        delete_json = []
+        add_json = [{'new_object_id': obj['object_id'], 'bounding_box': obj['bounding_box']} for obj in new_json]
+    return {'new': new_json, 'match': match_json, 'delete': delete_json, 'add': add_json}
+
+def diff_upload_request(manifest, crops, names):
+    """Prepared POST of the manifest plus the crops in `names`."""
+    content_type = CROP_FORMATS[CROP_FORMAT][1]
+    files = []
+    for obj in manifest['new']:
+        filename = os.path.basename(obj['image_path'])
+        if filename in names and filename in crops:
+            files.append(('crops', (filename, crops[filename], content_type)))
+    return requests.Request(
+        'POST', DIFF_UPLOAD_URL, data={'manifest': json.dumps(manifest)}, files=files
+    ).prepare(), len(files)
+
+def upload_diff(json_path, old_json_path, crops):
+    manifest = build_diff_manifest(json_path, old_json_path)
+    # Matched objects keep their crop on the backend, so only added objects are sent
+    id_to_name = {obj['object_id']: os.path.basename(obj['image_path']) for obj in manifest['new']}
+    names = {id_to_name[entry['new_object_id']] for entry in manifest['add'] if entry['new_object_id'] in id_to_name}
+
+    try:
+        with requests.Session() as session:
+            # The backend names the matched crops it cannot carry over; they are sent once more
+            for attempt in range(2):
+                prepared, sent = diff_upload_request(manifest, crops, names)
+                start = time.perf_counter()
+                upload_response = session.send(prepared)
+                elapsed = time.perf_counter() - start
+                print(f"[upload] diff: {len(prepared.body)} bytes, {sent} crops, {elapsed:.3f}s")
+                if upload_response.status_code != 200:
+                    return {
+                        'error': f'Failed to upload diff. Status code: {upload_response.status_code}',
+                        'response': upload_response.text
+                    }
+                reply = upload_response.json()
+                if reply.get('status') != 'missing_crops':
+                    return {
+                        'message': 'Processing completed successfully',
+                        'upload_response': upload_response.text
+                    }
+                print(f"[upload] backend is missing {reply['missing']}, resending them")
+                names |= set(reply['missing'])
+        return {'error': f"Backend still missing crops {reply['missing']}"}
+    except Exception as e:
+        return {'error': f'Error uploading diff: {str(e)}'}
+
+def upload_results():
     # Create zip file
     zip_filename = 'data.zip'
     shutil.make_archive('data', 'zip', RESULT_DIR)
@@ -50,8 +250,10 @@ def process_image(img_path):
             files = {
                 'file': (zip_filename, f, 'application/zip')
             }
+            start = time.perf_counter()
             upload_response = requests.post(UPLOAD_URL, files=files)
-            print("post issue")
+            elapsed = time.perf_counter() - start
+            print(f"[upload] zip: {os.path.getsize(zip_filename)} bytes, {elapsed:.3f}s")
             if upload_response.status_code == 200:
                 return {
                     'message': 'Processing completed successfully',
@@ -65,6 +267,12 @@ def process_image(img_path):
     except Exception as e:
         return {'error': f'Error uploading results: {str(e)}'}
 
+def log_job_result(future):
+    try:
+        print(f"[process] {future.result()}")
+    except Exception as e:
+        print(f"[ERROR] Processing failed: {e}")
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({
@@ -73,7 +281,8 @@ def home():
             '/': 'This help message',
             '/process': 'GET endpoint to trigger image processing',
             '/upload': 'POST endpoint for file uploads',
-            '/status': 'GET endpoint to check server status'
+            '/status': 'GET endpoint to check server status',
+            '/detector': 'GET endpoint for detector timings and batching stats'
         }
     })
 
@@ -81,22 +290,26 @@ def home():
 def process_post():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
-    file = request.files['file']
-    if file.filename == '':
+    # Several photos can be sent at once as repeated 'file' fields
+    files = [f for f in request.files.getlist('file') if f.filename != '']
+    if not files:
         return jsonify({'error': 'No selected file'}), 400
-    if file:
+    uploaded = []
+    for file in files:
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(file_path)
-        # Respond immediately
-        response = {
-            'message': 'File uploaded successfully, processing started.',
-            'filename': filename,
-            'size': os.path.getsize(file_path)
-        }
-        # Start processing in background
-        Thread(target=process_image, args=(file_path,)).start()
-        return jsonify(response)
+        uploaded.append({'filename': filename, 'size': os.path.getsize(file_path)})
+        # Start processing in background; detection is batched across concurrent jobs
+        submit_image(file_path).add_done_callback(log_job_result)
+    # Respond immediately
+    response = {
+        'message': 'File uploaded successfully, processing started.',
+        'filename': uploaded[0]['filename'],
+        'size': uploaded[0]['size'],
+        'files': uploaded
+    }
+    return jsonify(response)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -125,5 +338,17 @@ def status():
         'files': os.listdir(app.config['UPLOAD_FOLDER'])
     })
 
+@app.route('/detector', methods=['GET'])
+def detector_status():
+    if detector is None:
+        return jsonify({'loaded': False})
+    stats = {'loaded': True, **detector.stats()}
+    if batcher is not None:
+        stats['batching'] = batcher.stats()
+    return jsonify(stats)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True) 
\ No newline at end of file
+    # Load the model before accepting requests so the first photo is not penalized
+    get_batcher()
+    # The reloader would re-import this module and load the weights a second time
+    app.run(host='0.0.0.0', port=8000, debug=True, use_reloader=False) 
\ No newline at end of file
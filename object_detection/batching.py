@@ -0,0 +1,91 @@
+import queue
+import time
+from concurrent.futures import Future
+from threading import Thread, Lock
+
+
+class MicroBatcher:
+    """Coalesces detection requests that arrive close together into one batched forward pass.
+
+    Callers submit single images; a worker thread waits up to `max_wait` seconds
+    after the first pending request for up to `max_batch_size` images, runs them
+    through `detector.detect_batch` and resolves each caller's future with its
+    own result. It exposes the same `detect` method as the detector, so it can
+    be passed anywhere a detector is expected.
+    """
+
+    def __init__(self, detector, max_batch_size=8, max_wait=0.05):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+
+        self.stats_lock = Lock()
+        self.batch_count = 0
+        self.image_count = 0
+        self.last_batch_size = 0
+
+        self.worker = Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, image_rgb, threshold=0.3, text_threshold=0.1):
+        """Queue an RGB image for detection and return a Future for its result."""
+        future = Future()
+        self.requests.put((image_rgb, threshold, text_threshold, future))
+        return future
+
+    def detect(self, image_rgb, threshold=0.3, text_threshold=0.1):
+        return self.submit(image_rgb, threshold, text_threshold).result()
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Post-processing takes a single threshold pair, so group requests by it
+            groups = {}
+            for request in batch:
+                groups.setdefault((request[1], request[2]), []).append(request)
+            for (threshold, text_threshold), requests in groups.items():
+                self._run_group(requests, threshold, text_threshold)
+
+    def _run_group(self, requests, threshold, text_threshold):
+        try:
+            results = self.detector.detect_batch(
+                [image for image, _, _, _ in requests],
+                threshold=threshold,
+                text_threshold=text_threshold
+            )
+        except Exception as e:
+            for _, _, _, future in requests:
+                future.set_exception(e)
+            return
+        for (_, _, _, future), result in zip(requests, results):
+            future.set_result(result)
+        with self.stats_lock:
+            self.batch_count += 1
+            self.image_count += len(requests)
+            self.last_batch_size = len(requests)
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait': self.max_wait,
+                'pending': self.requests.qsize(),
+                'batch_count': self.batch_count,
+                'image_count': self.image_count,
+                'last_batch_size': self.last_batch_size,
+                'avg_batch_size': self.image_count / self.batch_count if self.batch_count else None,
+            }
@@ -0,0 +1,259 @@
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from box_ops import calculate_iou, nms
+from object_detection import GroundingDinoDetector
+from roi import detect_incremental
+
+
+def load_images(paths):
+    """Load a fixed set of fridge images as RGB arrays (directories are expanded to their images)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for ext in ('*.png', '*.jpg', '*.jpeg'):
+                files.extend(glob.glob(os.path.join(path, ext)))
+        else:
+            files.append(path)
+    images = []
+    for f in sorted(files):
+        image = cv2.imread(f)
+        if image is None:
+            print(f"[WARN] Could not read {f}, skipping")
+            continue
+        images.append((f, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+    return images
+
+
+def box_agreement(reference, candidate, iou_threshold=0.5):
+    """Fraction of reference boxes that have a same-label candidate box with IoU >= iou_threshold."""
+    if not reference:
+        return 1.0 if not candidate else 0.0
+    matched = 0
+    for ref_box, ref_label in reference:
+        for box, label in candidate:
+            if label == ref_label and calculate_iou(ref_box, box) >= iou_threshold:
+                matched += 1
+                break
+    return matched / len(reference)
+
+
+def to_boxes(result):
+    boxes = result['boxes'].detach().cpu().numpy().tolist()
+    return list(zip(boxes, result['labels']))
+
+
+def bench_backends(args):
+    images = load_images(args.images)
+    if not images:
+        print("No images found")
+        return
+
+    reference = None
+    rows = []
+    for precision in args.precisions:
+        try:
+            detector = GroundingDinoDetector(device=args.device, precision=precision, num_threads=args.threads)
+        except ValueError as e:
+            print(f"[SKIP] {precision}: {e}")
+            continue
+        # Warm up so lazy initialization is not counted as inference time
+        detector.detect(images[0][1], threshold=args.threshold)
+
+        outputs = []
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            outputs = [to_boxes(detector.detect(image, threshold=args.threshold)) for _, image in images]
+        elapsed = time.perf_counter() - start
+        images_per_sec = args.repeat * len(images) / elapsed
+
+        # The first precision in the list (fp32 by default) is the reference
+        if reference is None:
+            reference = outputs
+        agreement = sum(box_agreement(ref, out) for ref, out in zip(reference, outputs)) / len(images)
+        rows.append((precision, detector.device, detector.num_threads, detector.load_time, images_per_sec, agreement))
+        del detector
+
+    print(f"\n{'precision':<10}{'device':<8}{'threads':<9}{'load (s)':<10}{'images/s':<10}{'agreement':<10}")
+    for precision, device, threads, load_time, images_per_sec, agreement in rows:
+        print(f"{precision:<10}{device:<8}{threads:<9}{load_time:<10.2f}{images_per_sec:<10.3f}{agreement:<10.3f}")
+
+
+def bench_batching(args):
+    images = load_images(args.images)
+    if not images:
+        print("No images found")
+        return
+    detector = GroundingDinoDetector(device=args.device, precision=args.precision, num_threads=args.threads)
+    detector.detect(images[0][1], threshold=args.threshold)
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        # Cycle through the image set so every batch is full
+        batch = [images[i % len(images)][1] for i in range(batch_size)]
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            detector.detect_batch(batch, threshold=args.threshold)
+        elapsed = time.perf_counter() - start
+        rows.append((batch_size, elapsed / args.repeat, args.repeat * batch_size / elapsed))
+
+    print(f"\n{'batch':<8}{'latency (s)':<14}{'images/s':<10}")
+    for batch_size, latency, images_per_sec in rows:
+        print(f"{batch_size:<8}{latency:<14.3f}{images_per_sec:<10.3f}")
+
+
+def legacy_filter(boxes):
+    """The original pairwise loop from detect_objects: drop a box overlapping any earlier one."""
+    keep = []
+    for i, box1 in enumerate(boxes):
+        is_redundant = False
+        for j, box2 in enumerate(boxes):
+            if i > j:
+                if calculate_iou(box1, box2) > 0.4:
+                    is_redundant = True
+                    break
+        if not is_redundant:
+            keep.append(i)
+    return keep
+
+
+def random_boxes(n, rng, width=1080, height=720):
+    x1 = rng.uniform(0, width - 50, n)
+    y1 = rng.uniform(0, height - 50, n)
+    w = rng.uniform(20, 300, n)
+    h = rng.uniform(20, 300, n)
+    boxes = np.stack([x1, y1, np.minimum(x1 + w, width), np.minimum(y1 + h, height)], axis=1)
+    return boxes.astype(int).tolist()
+
+
+def bench_nms(args):
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':<8}{'loop (ms)':<12}{'nms (ms)':<12}{'speedup':<10}")
+    for n in args.sizes:
+        boxes = random_boxes(n, rng)
+        scores = rng.uniform(0.3, 1.0, n).tolist()
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            legacy_filter(boxes)
+        loop_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            nms(boxes, scores, iou_threshold=0.4)
+        nms_time = (time.perf_counter() - start) / args.repeat
+
+        print(f"{n:<8}{loop_time * 1000:<12.2f}{nms_time * 1000:<12.2f}{loop_time / nms_time:<10.1f}")
+
+
+def synthetic_change(image, fraction, rng):
+    """Copy of a BGR image with a patch covering `fraction` of it replaced by content from elsewhere."""
+    if fraction <= 0:
+        return image.copy()
+    height, width = image.shape[:2]
+    patch_h = max(1, int(height * fraction ** 0.5))
+    patch_w = max(1, int(width * fraction ** 0.5))
+    changed = image.copy()
+    sy, sx = rng.integers(0, height - patch_h + 1), rng.integers(0, width - patch_w + 1)
+    dy, dx = rng.integers(0, height - patch_h + 1), rng.integers(0, width - patch_w + 1)
+    # Flipped, so the patch differs from the frame even where source and destination overlap
+    changed[dy:dy + patch_h, dx:dx + patch_w] = image[sy:sy + patch_h, sx:sx + patch_w][::-1, ::-1]
+    return changed
+
+
+def bench_roi(args):
+    images = load_images(args.images)
+    if not images:
+        print("No images found")
+        return
+    detector = GroundingDinoDetector(device=args.device, precision=args.precision, num_threads=args.threads)
+    detector.detect(images[0][1], threshold=args.threshold)
+
+    def detect_many(batch):
+        return detector.detect_batch(batch, threshold=args.threshold)
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for fraction in args.fractions:
+        full_time = roi_time = agreement = 0.0
+        modes = set()
+        for _, image_rgb in images:
+            prev_bgr = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
+            prev_objects = [
+                {'bounding_box': [int(x) for x in box], 'score': 1.0, 'label': label}
+                for box, label in to_boxes(detector.detect(image_rgb, threshold=args.threshold))
+            ]
+            new_bgr = synthetic_change(prev_bgr, fraction, rng)
+            new_rgb = cv2.cvtColor(new_bgr, cv2.COLOR_BGR2RGB)
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                full = detector.detect(new_rgb, threshold=args.threshold)
+                full_time += time.perf_counter() - start
+                start = time.perf_counter()
+                incremental, info = detect_incremental(
+                    detect_many, prev_bgr, new_bgr, prev_objects,
+                    max_changed_fraction=args.max_changed, pad=args.pad
+                )
+                roi_time += time.perf_counter() - start
+            modes.add(info['mode'])
+            agreement += box_agreement(to_boxes(full), to_boxes(incremental))
+        runs = args.repeat * len(images)
+        rows.append((fraction, '/'.join(sorted(modes)), full_time / runs, roi_time / runs, agreement / len(images)))
+
+    print(f"\n{'changed':<9}{'mode':<11}{'full (s)':<10}{'roi (s)':<10}{'speedup':<9}{'agreement':<10}")
+    for fraction, mode, full_latency, roi_latency, agreement in rows:
+        print(f"{fraction:<9.2f}{mode:<11}{full_latency:<10.3f}{roi_latency:<10.3f}"
+              f"{full_latency / roi_latency:<9.1f}{agreement:<10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the object detection server")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backends = subparsers.add_parser('backends', help='images/sec and box agreement per device/precision')
+    backends.add_argument('--images', nargs='+', default=['fruit.png'], help='image files or directories')
+    backends.add_argument('--device', default='auto')
+    backends.add_argument('--precisions', nargs='+', default=['fp32', 'bf16', 'int8'])
+    backends.add_argument('--threads', type=int, default=None)
+    backends.add_argument('--threshold', type=float, default=0.3)
+    backends.add_argument('--repeat', type=int, default=3)
+    backends.set_defaults(func=bench_backends)
+
+    batching = subparsers.add_parser('batching', help='throughput of detect_batch at several batch sizes')
+    batching.add_argument('--images', nargs='+', default=['fruit.png'], help='image files or directories')
+    batching.add_argument('--device', default='auto')
+    batching.add_argument('--precision', default='fp32')
+    batching.add_argument('--threads', type=int, default=None)
+    batching.add_argument('--threshold', type=float, default=0.3)
+    batching.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8])
+    batching.add_argument('--repeat', type=int, default=3)
+    batching.set_defaults(func=bench_batching)
+
+    nms_parser = subparsers.add_parser('nms', help='vectorized NMS against the original pairwise loop')
+    nms_parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 1000])
+    nms_parser.add_argument('--repeat', type=int, default=5)
+    nms_parser.set_defaults(func=bench_nms)
+
+    roi = subparsers.add_parser('roi', help='incremental ROI re-detection latency against full-frame, per changed-area fraction')
+    roi.add_argument('--images', nargs='+', default=['fruit.png'], help='image files or directories')
+    roi.add_argument('--device', default='auto')
+    roi.add_argument('--precision', default='fp32')
+    roi.add_argument('--threads', type=int, default=None)
+    roi.add_argument('--threshold', type=float, default=0.3)
+    roi.add_argument('--fractions', type=float, nargs='+', default=[0.0, 0.02, 0.05, 0.1, 0.2, 0.4])
+    roi.add_argument('--max-changed', type=float, default=0.3)
+    roi.add_argument('--pad', type=int, default=32)
+    roi.add_argument('--repeat', type=int, default=3)
+    roi.set_defaults(func=bench_roi)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
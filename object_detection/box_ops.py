@@ -0,0 +1,76 @@
+import numpy as np
+
+
+# Function to calculate IoU
+def calculate_iou(box1, box2):
+    x1, y1, x2, y2 = box1
+    x1_p, y1_p, x2_p, y2_p = box2
+
+    # Calculate the intersection coordinates
+    xi1 = max(x1, x1_p)
+    yi1 = max(y1, y1_p)
+    xi2 = min(x2, x2_p)
+    yi2 = min(y2, y2_p)
+
+    # Calculate the area of intersection
+    inter_width = max(0, xi2 - xi1)
+    inter_height = max(0, yi2 - yi1)
+    intersection = inter_width * inter_height
+
+    # Calculate the area of both bounding boxes
+    box1_area = (x2 - x1) * (y2 - y1)
+    box2_area = (x2_p - x1_p) * (y2_p - y1_p)
+
+    # Calculate the union area
+    union = box1_area + box2_area - intersection
+
+    # Calculate IoU
+    iou = intersection / union if union != 0 else 0
+    return iou
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between two sets of [x1, y1, x2, y2] boxes, shape (len(boxes_a), len(boxes_b))."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+
+    # Broadcast (N, 1) against (1, M) to get every intersection at once
+    xi1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    yi1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    xi2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    yi2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(xi2 - xi1, 0, None) * np.clip(yi2 - yi1, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    # Same convention as calculate_iou: a zero union gives an IoU of 0
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union != 0)
+
+
+def nms(boxes, scores, iou_threshold=0.4, labels=None):
+    """Score-sorted non-maximum suppression.
+
+    Returns the indices of the kept boxes, highest score first. When `labels`
+    is given, a box only suppresses boxes carrying the same label.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if len(boxes) == 0:
+        return []
+
+    order = np.argsort(-scores, kind='stable')
+    ious = iou_matrix(boxes, boxes)
+    if labels is not None:
+        labels = np.asarray(labels)
+        ious = np.where(labels[:, None] == labels[None, :], ious, 0.0)
+
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(int(i))
+        suppressed |= ious[i] > iou_threshold
+    return keep
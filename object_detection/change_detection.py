@@ -1,31 +1,39 @@
 import json
 import os
-# Function to calculate IoU
-def calculate_iou(box1, box2):
-    x1, y1, x2, y2 = box1
-    x1_p, y1_p, x2_p, y2_p = box2
 
-    # Calculate the intersection coordinates
-    xi1 = max(x1, x1_p)
-    yi1 = max(y1, y1_p)
-    xi2 = min(x2, x2_p)
-    yi2 = min(y2, y2_p)
+import numpy as np
+from box_ops import iou_matrix
 
-    # Calculate the area of intersection
-    inter_width = max(0, xi2 - xi1)
-    inter_height = max(0, yi2 - yi1)
-    intersection = inter_width * inter_height
 
-    # Calculate the area of both bounding boxes
-    box1_area = (x2 - x1) * (y2 - y1)
-    box2_area = (x2_p - x1_p) * (y2_p - y1_p)
+def match_objects(old_objects, new_objects, iou_threshold=0.8):
+    """One-to-one matching of old and new objects by IoU.
 
-    # Calculate the union area
-    union = box1_area + box2_area - intersection
+    Candidate pairs above `iou_threshold` are taken greedily in order of
+    descending IoU, so each object is matched at most once and the strongest
+    overlaps win. Returns (matches, unmatched_old, unmatched_new) where the
+    unmatched lists keep the input order.
+    """
+    ious = iou_matrix([obj['bounding_box'] for obj in old_objects], [obj['bounding_box'] for obj in new_objects])
+    rows, cols = np.nonzero(ious > iou_threshold)
+    order = np.argsort(-ious[rows, cols], kind='stable')
 
-    # Calculate IoU
-    iou = intersection / union if union != 0 else 0
-    return iou
+    matched_old = set()
+    matched_new = set()
+    matches = []
+    for i, j in zip(rows[order], cols[order]):
+        if i in matched_old or j in matched_new:
+            continue
+        matched_old.add(i)
+        matched_new.add(j)
+        matches.append({
+            'old_object_id': old_objects[i]['object_id'],
+            'new_object_id': new_objects[j]['object_id'],
+            'iou': float(ious[i, j])
+        })
+
+    unmatched_old = [obj for i, obj in enumerate(old_objects) if i not in matched_old]
+    unmatched_new = [obj for j, obj in enumerate(new_objects) if j not in matched_new]
+    return matches, unmatched_old, unmatched_new
 
 # Function to check for matching objects
 def check_matching_objects(old_json, new_json, save_dir, iou_threshold=0.8):
@@ -35,19 +43,7 @@ def check_matching_objects(old_json, new_json, save_dir, iou_threshold=0.8):
         data2 = json.load(f2)
 
     # Check for matches and unmatched objects
-    matches = []
-    unmatched_old = data1.copy()
-    unmatched_new = data2.copy()
-
-    for obj1 in data1:
-        for obj2 in data2:
-            iou = calculate_iou(obj1['bounding_box'], obj2['bounding_box'])
-            if iou > iou_threshold:
-                matches.append({'old_object_id': obj1['object_id'], 'new_object_id': obj2['object_id'], 'iou': iou})
-                if obj1 in unmatched_old:
-                    unmatched_old.remove(obj1)
-                if obj2 in unmatched_new:
-                    unmatched_new.remove(obj2)
+    matches, unmatched_old, unmatched_new = match_objects(data1, data2, iou_threshold)
 
     # Prepare unmatched objects with specific key names
     unmatched_old_formatted = [{'old_object_id': obj['object_id'], 'bounding_box': obj['bounding_box']} for obj in unmatched_old] # object_id -> id in old.json
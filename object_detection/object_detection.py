@@ -5,69 +5,182 @@ import cv2
 import numpy as np
 import json
 import os
+import time
+import contextlib
 
 import torch
 from PIL import Image
 from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
 
-    # Function to calculate IoU
-def calculate_iou(box1, box2):
-    x1, y1, x2, y2 = box1
-    x1_p, y1_p, x2_p, y2_p = box2
-
-    # Calculate the intersection coordinates
-    xi1 = max(x1, x1_p)
-    yi1 = max(y1, y1_p)
-    xi2 = min(x2, x2_p)
-    yi2 = min(y2, y2_p)
-
-    # Calculate the area of intersection
-    inter_width = max(0, xi2 - xi1)
-    inter_height = max(0, yi2 - yi1)
-    intersection = inter_width * inter_height
-
-    # Calculate the area of both bounding boxes
-    box1_area = (x2 - x1) * (y2 - y1)
-    box2_area = (x2_p - x1_p) * (y2_p - y1_p)
-
-    # Calculate the union area
-    union = box1_area + box2_area - intersection
-
-    # Calculate IoU
-    iou = intersection / union if union != 0 else 0
-    return iou
-
-def detect_objects(img_path, json_path, save_dir, threshold=0.3):
-    # Load the model and processor
-    model_id = "IDEA-Research/grounding-dino-base"
-    device = "cuda"
-    processor = AutoProcessor.from_pretrained(model_id)
-    model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(device)
-    detect_save_dir='detect_result'
+from box_ops import nms
+
+
+MODEL_ID = "IDEA-Research/grounding-dino-base"
+TEXT_LABELS = ["box", "bottle", "vegetable", "meat", "bread", "fruit", "drink", "food"]
+
+
+PRECISIONS = ("fp32", "fp16", "bf16", "int8")
+# Output encoders for object crops: file extension and content type
+CROP_FORMATS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+
+def encode_crop(crop, fmt="png", quality=90):
+    """Encode a BGR crop (usually a view into the full image) to bytes in the given format."""
+    if fmt not in CROP_FORMATS:
+        raise ValueError(f"Unknown crop format {fmt!r}, expected one of {tuple(CROP_FORMATS)}")
+    if fmt == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif fmt == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = []
+    ok, buffer = cv2.imencode(CROP_FORMATS[fmt][0], crop, params)
+    if not ok:
+        raise ValueError(f"Failed to encode crop as {fmt}")
+    return buffer.tobytes()
+
+
+def select_device(device=None):
+    """Resolve "auto"/None to cuda when a GPU is present, otherwise cpu."""
+    if device in (None, "auto"):
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+class GroundingDinoDetector:
+    """Grounding DINO model kept resident between calls.
+
+    The processor, model weights and tokenized text prompts are loaded once in
+    the constructor, so `detect` only pays for image preprocessing and the
+    forward pass.
+
+    `device` may be "cuda", "cpu" or "auto"/None (cuda if available). On top of
+    full precision ("fp32") the model can run under fp16 autocast (cuda only),
+    bf16 autocast, or with its Linear layers dynamically quantized to int8
+    (cpu only). `num_threads` caps the intra-op threads torch uses on cpu.
+    """
+
+    def __init__(self, model_id=MODEL_ID, text_labels=TEXT_LABELS, device=None, precision="fp32", num_threads=None):
+        device = select_device(device)
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+        if precision == "fp16" and device == "cpu":
+            raise ValueError("fp16 is only supported on cuda, use bf16 or int8 on cpu")
+        if precision == "int8" and device != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on cpu")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.model_id = model_id
+        self.text_labels = list(text_labels)
+        self.device = device
+        self.precision = precision
+        self.num_threads = torch.get_num_threads()
+
+        start = time.perf_counter()
+        self.processor = AutoProcessor.from_pretrained(model_id)
+        model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id)
+        if precision == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model.to(device)
+        self.model.eval()
+        # The prompt never changes, so tokenize it once and reuse it for every image
+        self.text_inputs = self.processor(text=[self.text_labels], return_tensors="pt").to(device)
+        self.load_time = time.perf_counter() - start
+
+        self.last_inference_time = None
+        self.inference_count = 0
+        self.total_inference_time = 0.0
+        print(f"[detector] {model_id} loaded on {device} ({precision}, {self.num_threads} threads) in {self.load_time:.2f}s")
+
+    def _autocast(self):
+        if self.precision == "bf16":
+            return torch.autocast(device_type=self.device, dtype=torch.bfloat16)
+        if self.precision == "fp16":
+            return torch.autocast(device_type=self.device, dtype=torch.float16)
+        return contextlib.nullcontext()
+
+    def detect(self, image_rgb, threshold=0.3, text_threshold=0.1):
+        """Run detection on an RGB image (H x W x 3 array) and return the post-processed result."""
+        return self.detect_batch([image_rgb], threshold=threshold, text_threshold=text_threshold)[0]
+
+    def detect_batch(self, images_rgb, threshold=0.3, text_threshold=0.1):
+        """Run detection on several RGB images as one padded batch, returning one result per image."""
+        start = time.perf_counter()
+        batch_size = len(images_rgb)
+        # The image processor pads the batch to a common size and returns the matching pixel_mask
+        image_inputs = self.processor.image_processor(images=list(images_rgb), return_tensors="pt").to(self.device)
+        text_inputs = {k: v.repeat(batch_size, 1) for k, v in self.text_inputs.items()}
+        with torch.no_grad(), self._autocast():
+            outputs = self.model(**image_inputs, **text_inputs)
+
+        results = self.processor.post_process_grounded_object_detection(
+            outputs,
+            text_inputs['input_ids'],
+            box_threshold=threshold,
+            text_threshold=text_threshold,
+            target_sizes=[(image.shape[0], image.shape[1]) for image in images_rgb]
+        )
+        # Reduced-precision runs return half tensors, which numpy cannot convert
+        for result in results:
+            result['boxes'] = result['boxes'].float()
+            result['scores'] = result['scores'].float()
+
+        self.last_inference_time = time.perf_counter() - start
+        self.inference_count += batch_size
+        self.total_inference_time += self.last_inference_time
+        print(f"[detector] inference on {batch_size} image(s) took {self.last_inference_time:.3f}s")
+        return results
+
+    def stats(self):
+        return {
+            'model_id': self.model_id,
+            'device': self.device,
+            'precision': self.precision,
+            'num_threads': self.num_threads,
+            'load_time': self.load_time,
+            'last_inference_time': self.last_inference_time,
+            'inference_count': self.inference_count,
+            # Per image, so batched runs are comparable with single-image ones
+            'avg_inference_time': self.total_inference_time / self.inference_count if self.inference_count else None,
+        }
+
+
+def detect_objects(img_path, json_path, save_dir, threshold=0.3, detector=None, crop_format="png", crop_quality=90, debug_dir=None):
+    # Fall back to a one-off model load when no resident detector is supplied
+    if detector is None:
+        detector = GroundingDinoDetector()
     # Load the image using OpenCV
     image = cv2.imread(img_path)
 
     # Convert BGR to RGB for correct color representation
     image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    # Define text labels
-    text_labels = [["box", "bottle", "vegetable", "meat", "bread", "fruit", "drink", "food"]]
-
-    # Prepare inputs
-    inputs = processor(images=image_rgb, text=text_labels, return_tensors="pt").to(device)
-    with torch.no_grad():
-        outputs = model(**inputs)
-
-    # Post-process results
-    results = processor.post_process_grounded_object_detection(
-        outputs,
-        inputs.input_ids,
-        box_threshold=threshold,
-        text_threshold=0.1,
-        target_sizes=[(image.shape[0], image.shape[1])]  # Use height and width from OpenCV
+    result = detector.detect(image_rgb, threshold=threshold)
+    return save_detections(
+        image, result, json_path, save_dir, threshold=threshold,
+        crop_format=crop_format, crop_quality=crop_quality, debug_dir=debug_dir
     )
 
-    result = results[0]
+
+def save_detections(image, result, json_path, save_dir, threshold=0.3, nms_threshold=0.4, class_aware=False,
+                    crop_format="png", crop_quality=90, debug_dir=None):
+    """Filter a detector result, write the object crops from `image` (BGR) and the JSON description.
+
+    Overlapping boxes are removed with score-sorted NMS; with `class_aware` a
+    box only suppresses boxes that were detected under the same text label.
+    Crops stay as views into `image` until the surviving ones are encoded once
+    with `crop_format` ("png", "jpeg" or "webp", `crop_quality` for the lossy
+    ones). Every candidate before filtering is only dumped when `debug_dir` is
+    set. Returns the object list and a dict of crop filename -> encoded bytes.
+    """
+    if crop_format not in CROP_FORMATS:
+        raise ValueError(f"Unknown crop format {crop_format!r}, expected one of {tuple(CROP_FORMATS)}")
+    extension = CROP_FORMATS[crop_format][0]
     for box, score, labels in zip(result["boxes"], result["scores"], result["labels"]):
         box = [round(x, 2) for x in box.tolist()]
         print(f"Detected {labels} with confidence {round(score.item(), 3)} at location {box}")
@@ -83,48 +196,57 @@ def detect_objects(img_path, json_path, save_dir, threshold=0.3):
     # Draw bounding boxes and crop objects using OpenCV
     object_id = 0
     object_idd = 0
-    for box, score in zip(boxes, scores):
+    for box, score, label in zip(boxes, scores, result['labels']):
         if score > threshold:  # Confidence threshold
             x1, y1, x2, y2 = map(int, box)
             object_data.append({
                 'object_id': object_idd,
                 'bounding_box': [x1, y1, x2, y2],
+                'score': float(score),
+                'label': label,
             })
-            object_image_path = os.path.join(detect_save_dir, f'object_{object_idd}.png')
-            # x1, y1, x2, y2 = map(int, obj1['bounding_box'])
-            cropped_object = image[y1:y2, x1:x2]
-            cv2.imwrite(object_image_path, cropped_object)
+            if debug_dir:
+                cv2.imwrite(os.path.join(debug_dir, f'object_{object_idd}.png'), image[y1:y2, x1:x2])
             object_idd+=1
         
             
 
-    # Remove redundant boxes based on IoU before writing to JSON
+    # Remove redundant boxes based on IoU before writing to JSON, keeping the best-scoring one
+    keep = nms(
+        [obj['bounding_box'] for obj in object_data],
+        [obj['score'] for obj in object_data],
+        iou_threshold=nms_threshold,
+        labels=[obj['label'] for obj in object_data] if class_aware else None
+    )
     filtered_object_data = []
-    for i, obj1 in enumerate(object_data):
-        is_redundant = False
-        for j, obj2 in enumerate(object_data):
-            if i > j:
-                iou = calculate_iou(obj1['bounding_box'], obj2['bounding_box'])
-                if iou > 0.4:
-                    is_redundant = True
-                    break
-        if not is_redundant:
-            object_image_path = os.path.join(save_dir, f'object_{object_id}.png')
-            x1, y1, x2, y2 = map(int, obj1['bounding_box'])
-            cropped_object = image[y1:y2, x1:x2]
-            cv2.imwrite(object_image_path, cropped_object)
-            filtered_object_data.append({
-                'object_id': object_id,
-                'bounding_box': obj1['bounding_box'],
-                'image_path': object_image_path
-            })
-            print(f"filtered_object:{object_id}, {object_image_path}")
-            object_id += 1
+    crops = {}
+    # Number survivors in detection order, as before
+    for i in sorted(keep):
+        obj1 = object_data[i]
+        filename = f'object_{object_id}{extension}'
+        object_image_path = os.path.join(save_dir, filename)
+        x1, y1, x2, y2 = map(int, obj1['bounding_box'])
+        # Encode once; the bytes are reused for the upload instead of reading the file back
+        crops[filename] = encode_crop(image[y1:y2, x1:x2], crop_format, crop_quality)
+        with open(object_image_path, 'wb') as f:
+            f.write(crops[filename])
+        filtered_object_data.append({
+            'object_id': object_id,
+            'bounding_box': obj1['bounding_box'],
+            'image_path': object_image_path,
+            # Kept so incremental detection can carry the object over unchanged
+            'score': obj1['score'],
+            'label': obj1['label']
+        })
+        print(f"filtered_object:{object_id}, {object_image_path}")
+        object_id += 1
 
     # Write the filtered object data to a JSON file
     with open(json_path, 'w') as json_file:
         json.dump(filtered_object_data, json_file, indent=4)
 
+    return filtered_object_data, crops
+
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,119 @@
+import cv2
+import torch
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _union(a, b):
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+def merge_regions(regions):
+    """Merge overlapping [x1, y1, x2, y2] rectangles until none overlap."""
+    regions = [list(r) for r in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                if _intersects(regions[i], regions[j]):
+                    regions[i] = _union(regions[i], regions.pop(j))
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def changed_regions(prev_bgr, new_bgr, pixel_threshold=25, scale=0.25, min_area=64):
+    """Bounding rectangles (full-resolution [x1, y1, x2, y2]) of the areas that differ between two frames.
+
+    The frames are compared downscaled by `scale` and blurred, so sensor noise
+    and JPEG artifacts do not register; blobs smaller than `min_area`
+    downscaled pixels are ignored.
+    """
+    def prepare(image):
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+    diff = cv2.absdiff(prepare(prev_bgr), prepare(new_bgr))
+    _, mask = cv2.threshold(diff, pixel_threshold, 255, cv2.THRESH_BINARY)
+    mask = cv2.dilate(mask, None, iterations=2)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        if cv2.contourArea(contour) < min_area:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        regions.append([int(x / scale), int(y / scale), int((x + w) / scale), int((y + h) / scale)])
+    return merge_regions(regions)
+
+
+def plan_regions(prev_bgr, new_bgr, prev_objects, pad=32, **diff_options):
+    """Regions to re-detect and the previous objects that can be carried over unchanged.
+
+    Each changed region is grown to cover the previous boxes it touches, so a
+    moved or partly covered object is re-detected whole, then padded. Returns
+    (regions, carried_objects, changed_fraction) where changed_fraction is the
+    share of the frame the regions cover.
+    """
+    height, width = new_bgr.shape[:2]
+    regions = changed_regions(prev_bgr, new_bgr, **diff_options)
+    boxes = [obj['bounding_box'] for obj in prev_objects]
+    grown = True
+    while grown:
+        grown = False
+        for i, region in enumerate(regions):
+            for box in boxes:
+                if _intersects(region, box) and _union(region, box) != region:
+                    regions[i] = _union(region, box)
+                    region = regions[i]
+                    grown = True
+        regions = merge_regions(regions)
+
+    regions = merge_regions([
+        [max(0, x1 - pad), max(0, y1 - pad), min(width, x2 + pad), min(height, y2 + pad)]
+        for x1, y1, x2, y2 in regions
+    ])
+    carried = [obj for obj in prev_objects if not any(_intersects(obj['bounding_box'], r) for r in regions)]
+    area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+    return regions, carried, area / float(width * height)
+
+
+def detect_incremental(detect_many, prev_bgr, new_bgr, prev_objects, max_changed_fraction=0.3, pad=32):
+    """Detect objects in new_bgr, re-running the detector only where it differs from prev_bgr.
+
+    `detect_many` takes a list of RGB images and returns one detector result
+    per image (e.g. a MicroBatcher-backed call). `prev_objects` are the objects
+    saved for prev_bgr (old.json entries). Falls back to a full-frame run when
+    there is no usable previous frame or the changed regions cover more than
+    `max_changed_fraction` of it. Returns a result in the detector's format,
+    plus a dict describing what was run.
+    """
+    new_rgb = cv2.cvtColor(new_bgr, cv2.COLOR_BGR2RGB)
+    if prev_bgr is None or prev_objects is None or prev_bgr.shape != new_bgr.shape:
+        return detect_many([new_rgb])[0], {'mode': 'full', 'reason': 'no previous frame'}
+
+    regions, carried, changed_fraction = plan_regions(prev_bgr, new_bgr, prev_objects, pad=pad)
+    info = {'regions': len(regions), 'carried': len(carried), 'changed_fraction': round(changed_fraction, 4)}
+    if changed_fraction > max_changed_fraction:
+        return detect_many([new_rgb])[0], {'mode': 'full', 'reason': 'changed area over threshold', **info}
+
+    boxes = [obj['bounding_box'] for obj in carried]
+    scores = [obj.get('score', 1.0) for obj in carried]
+    labels = [obj.get('label', 'carried') for obj in carried]
+    results = detect_many([new_rgb[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]) if regions else []
+    for (x1, y1, _, _), result in zip(regions, results):
+        # Shift region-local boxes back into frame coordinates
+        offset = torch.tensor([x1, y1, x1, y1], dtype=result['boxes'].dtype, device=result['boxes'].device)
+        boxes.extend((result['boxes'] + offset).tolist())
+        scores.extend(result['scores'].tolist())
+        labels.extend(result['labels'])
+    result = {
+        'boxes': torch.tensor(boxes, dtype=torch.float32).reshape(-1, 4),
+        'scores': torch.tensor(scores, dtype=torch.float32),
+        'labels': labels,
+    }
+    return result, {'mode': 'roi' if regions else 'unchanged', **info}